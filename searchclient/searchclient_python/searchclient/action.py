@@ -49,3 +49,7 @@ class Action(Enum):
         self.agent_col_delta = acd
         self.box_row_delta = brd
         self.box_col_delta = bcd
+
+# The position of every action in Action, which indexes the per-level tables of cell offsets (see Level).
+for _index, _action in enumerate(Action):
+    _action.index = _index
@@ -0,0 +1,244 @@
+import argparse
+import csv
+import fnmatch
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import psutil
+
+import cache
+import heuristic
+import memory
+from monitor import Monitor
+from searchclient import SearchClient
+from simulator import validate_plan
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+LEVELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'levels')
+FIELDS = ('level', 'strategy', 'status', 'plan_length', 'expanded', 'generated', 'time_s', 'peak_rss_mb')
+# Increases up to these amounts are never regressions, so that noise on small levels is not reported.
+SLACK = {'expanded': 0, 'time_s': 0.1, 'peak_rss_mb': 1.0}
+# The workers of -hdastar and -portfolio report their progress from their own processes, so it can not be read back;
+# the master of -hdastar only reports its total expansions, and whether a worker ran out of memory.
+HDA_FINISHED = re.compile(r'HDA\* finished after ([\d,]+) expansions\.')
+HDA_MEMORY = 'Maximum memory usage exceeded.'
+
+def find_levels(levels_dir: 'str', patterns: '[str, ...]') -> '[str, ...]':
+    '''
+    Returns the paths of the .lvl files in levels_dir whose names, with or without the extension, match any of the
+    shell-style patterns, sorted by name.
+    '''
+    names = sorted(name for name in os.listdir(levels_dir) if name.endswith('.lvl'))
+    return [os.path.join(levels_dir, name) for name in names if any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(name[:-4], pattern) for pattern in patterns)]
+
+def run_level(path: 'str', client_args: 'argparse.Namespace', time_limit: 'float') -> 'dict':
+    '''
+    Solves the level at path in a separate process, so that every level starts from a fresh heap and the search can
+    be stopped after time_limit seconds, and returns its record (see FIELDS).
+    
+    status is one of:
+        'solved':    the plan was found and validated by simulator.validate_plan.
+        'invalid':   the plan was found but not valid.
+        'unsolved':  the search ended without a plan.
+        'memory':    the search exceeded --max-memory.
+        'timeout':   the search did not end within time_limit.
+        'error':     the search raised an exception.
+    
+    expanded and generated are None when they are not known: generated with -hdastar, and both with -portfolio.
+    '''
+    name = os.path.splitext(os.path.basename(path))[0]
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_solve_level, args=(path, client_args, sender), daemon=False)
+    process.start()
+    sender.close()
+    
+    record = None
+    timed_out = False
+    try:
+        if receiver.poll(time_limit):
+            record = receiver.recv()
+    except EOFError:
+        pass
+    finally:
+        if process.is_alive():
+            timed_out = record is None
+            # Also stop the processes of -portfolio and -hdastar.
+            try:
+                for child in psutil.Process(process.pid).children(recursive=True):
+                    child.kill()
+            except psutil.NoSuchProcess:
+                pass
+            process.kill()
+        process.join()
+    
+    if record is None:
+        record = {'status': 'timeout', 'time_s': time_limit} if timed_out else {'status': 'error'}
+    record['level'] = name
+    return {field: record.get(field) for field in FIELDS}
+
+def _solve_level(path: 'str', client_args: 'argparse.Namespace', sender):
+    # Progress is reported as JSON lines (see monitor.Monitor), and read back for the counts.
+    client_args.status_format = 'json'
+    # The process object inherited from the benchmark would report the benchmark's memory.
+    memory._process = psutil.Process()
+    memory.max_usage = client_args.max_memory
+    cache.directory = client_args.cache_dir
+    cache.max_size = client_args.cache_size * 1024 * 1024
+    heuristic.use_numpy = client_args.numpy
+    stderr = sys.stderr
+    sys.stderr = io.StringIO()
+    
+    record = {}
+    try:
+        with open(path) as level_file:
+            start = time.perf_counter()
+            plan = SearchClient.find_plan(client_args, level_file)
+            record['time_s'] = round(time.perf_counter() - start, 3)
+        
+        expanded = generated = None
+        out_of_memory = False
+        for line in sys.stderr.getvalue().splitlines():
+            match = HDA_FINISHED.fullmatch(line)
+            if match is not None:
+                expanded = int(match.group(1).replace(',', ''))
+            out_of_memory = out_of_memory or (client_args.hdastar is not False and line == HDA_MEMORY)
+            if not line.startswith('{'):
+                continue
+            status = json.loads(line)
+            if status['event'] in Monitor.FINAL_EVENTS:
+                expanded = (expanded or 0) + status['explored']
+                generated = (generated or 0) + status['generated']
+                out_of_memory = out_of_memory or status['event'] == 'memory'
+        record['expanded'] = expanded
+        record['generated'] = generated
+        
+        if plan is None:
+            record['status'] = 'memory' if out_of_memory else 'unsolved'
+        else:
+            with open(path) as level_file:
+                problem = validate_plan(SearchClient.parse_level(level_file), plan)
+            record['status'] = 'solved' if problem is None else 'invalid'
+            record['plan_length'] = len(plan)
+            if problem is not None:
+                print('{}: {}'.format(os.path.basename(path), problem), file=stderr, flush=True)
+    except Exception as exception:
+        record['status'] = 'error'
+        print('{}: {!r}'.format(os.path.basename(path), exception), file=stderr, flush=True)
+    
+    if resource is not None:
+        # The worker processes of -portfolio and -hdastar have ended by now; for them, ru_maxrss holds the peak of the
+        # largest one, which is added to the peak of this process.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+        record['peak_rss_mb'] = round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 2)
+    else:
+        # Without resource, only the memory of this process is known, not that of worker processes. Its peak is
+        # only reported on Windows (peak_wset); elsewhere, the current usage is the best estimate.
+        info = memory._process.memory_info()
+        record['peak_rss_mb'] = round(getattr(info, 'peak_wset', info.rss) / (1024 * 1024), 2)
+    sender.send(record)
+    sender.close()
+
+def write_results(path: 'str', records: '[dict, ...]'):
+    '''
+    Writes records to path, as JSON if it ends in .json and as CSV otherwise.
+    '''
+    with open(path, 'w', newline='') as results_file:
+        if path.endswith('.json'):
+            json.dump(records, results_file, indent=2)
+        else:
+            writer = csv.DictWriter(results_file, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+
+def read_results(path: 'str') -> '[dict, ...]':
+    '''
+    Reads records written by write_results.
+    '''
+    with open(path, newline='') as results_file:
+        if path.endswith('.json'):
+            return json.load(results_file)
+        records = []
+        for row in csv.DictReader(results_file):
+            record = {field: row.get(field) or None for field in FIELDS}
+            for field in ('plan_length', 'expanded', 'generated'):
+                if record[field] is not None:
+                    record[field] = int(record[field])
+            for field in ('time_s', 'peak_rss_mb'):
+                if record[field] is not None:
+                    record[field] = float(record[field])
+            records.append(record)
+        return records
+
+def compare(records: '[dict, ...]', baseline: '[dict, ...]', tolerance: 'float') -> '[str, ...]':
+    '''
+    Returns a description of every regression of records against baseline, for levels in both: a level the
+    baseline solved that is no longer solved, a longer plan, or more expanded nodes, time or peak memory than the
+    baseline by more than the fraction tolerance (and SLACK).
+    '''
+    baseline = {record['level']: record for record in baseline}
+    regressions = []
+    for record in records:
+        old = baseline.get(record['level'])
+        if old is None or old['status'] != 'solved':
+            continue
+        if record['status'] != 'solved':
+            regressions.append('{}: {} (baseline solved)'.format(record['level'], record['status']))
+            continue
+        if record['plan_length'] > old['plan_length']:
+            regressions.append('{}: plan length {} (baseline {})'.format(record['level'], record['plan_length'], old['plan_length']))
+        for field, slack in SLACK.items():
+            if record[field] is not None and old[field] is not None and record[field] > max(old[field] * (1 + tolerance), old[field] + slack):
+                regressions.append('{}: {} {} (baseline {})'.format(record['level'], field, record[field], old[field]))
+    return regressions
+
+def main(argv: '[str, ...]' = None):
+    parser = argparse.ArgumentParser(description='Benchmark the searchclient on level files without the server. Arguments not listed here are passed to the searchclient, e.g. -astar.', allow_abbrev=False, add_help=False)
+    # Only --help, since -h would take searchclient arguments such as -hdastar for -h with an attached value.
+    parser.add_argument('--help', action='help', help='Show this help message and exit.')
+    parser.add_argument('--levels', metavar='<pattern>', nargs='+', default=['*'], help='Names of the levels to run, with shell-style wildcards, e.g. SA* (default all).')
+    parser.add_argument('--levels-dir', metavar='<dir>', default=LEVELS_DIR, help='The directory of the .lvl files (default searchclient/levels).')
+    parser.add_argument('--time-limit', metavar='<s>', type=float, default=60.0, help='Seconds allowed per level (default 60).')
+    parser.add_argument('--output', metavar='<file>', help='Write the results to <file>, as JSON if it ends in .json and as CSV otherwise.')
+    parser.add_argument('--baseline', metavar='<file>', help='Compare the results to an earlier --output file, and exit with status 1 on regressions.')
+    parser.add_argument('--tolerance', metavar='<fraction>', type=float, default=0.1, help='How much more expanded nodes, time and memory than the baseline is not a regression (default 0.1).')
+    args, client_argv = parser.parse_known_args(argv)
+    client_args = SearchClient.parse_arguments(client_argv)
+    strategy = ' '.join(client_argv) or '-bfs'
+    
+    paths = find_levels(args.levels_dir, args.levels)
+    if not paths:
+        parser.error('No levels match {}.'.format(' '.join(args.levels)))
+    
+    records = []
+    row_template = '{:<28} {:<9} {:>7} {:>11} {:>11} {:>9} {:>9}'
+    print(row_template.format('level', 'status', 'length', 'expanded', 'generated', 'time (s)', 'RSS (MB)'), flush=True)
+    for path in paths:
+        record = run_level(path, client_args, args.time_limit)
+        record['strategy'] = strategy
+        records.append(record)
+        print(row_template.format(*('' if record[field] is None else record[field] for field in ('level', 'status', 'plan_length', 'expanded', 'generated', 'time_s', 'peak_rss_mb'))), flush=True)
+    print('Solved {} of {} levels.'.format(sum(record['status'] == 'solved' for record in records), len(records)), flush=True)
+    
+    if args.output is not None:
+        write_results(args.output, records)
+    
+    if args.baseline is not None:
+        regressions = compare(records, read_results(args.baseline), args.tolerance)
+        for regression in regressions:
+            print('Regression: {}'.format(regression), flush=True)
+        if regressions:
+            sys.exit(1)
+        print('No regressions against {}.'.format(args.baseline), flush=True)
+
+if __name__ == '__main__':
+    main()
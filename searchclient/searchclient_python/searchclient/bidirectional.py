@@ -0,0 +1,122 @@
+import sys
+from array import array
+
+from action import Action, ActionType
+from monitor import Monitor
+from state import State
+
+def _inverse(action: 'Action') -> 'Action':
+    '''
+    Returns the action that undoes action: Move(d) is undone by Move(-d), Push(d1,d2) by Pull(-d1,d2),
+    and Pull(d1,d2) by Push(-d1,d2).
+    '''
+    _, action_type, agent_row_delta, agent_col_delta, box_row_delta, box_col_delta = action.value
+    inverse_type = {ActionType.Push: ActionType.Pull, ActionType.Pull: ActionType.Push}.get(action_type, action_type)
+    for inverse in Action:
+        if inverse.value[1:] == (inverse_type, -agent_row_delta, -agent_col_delta, box_row_delta, box_col_delta):
+            return inverse
+    raise ValueError('No inverse of {}.'.format(action))
+
+INVERSE = {action: _inverse(action) for action in Action}
+
+def goal_states(initial_state: 'State') -> '[State, ...]':
+    '''
+    Returns every state that satisfies the goals of the level of initial_state, or None if they can not be
+    enumerated. That requires a single agent, since joint actions of several agents can not always be undone
+    one agent at a time, and exactly as many goals as boxes for every box letter, so that every box must be on
+    a goal. The agent is placed on its goal, or on every free cell if it has none.
+    '''
+    level = initial_state.level
+    if len(initial_state.agents) != 1:
+        return None
+    
+    boxes = array('h')
+    for start, end in sorted(set(level.box_groups)):
+        goal_cells = sorted(cell for cell, goal in level.goal_cells if goal == level.box_letters[start])
+        if len(goal_cells) != end - start:
+            return None
+        boxes.extend(goal_cells)
+    if len(boxes) != len(level.box_letters):
+        return None
+    
+    if level.agent_goal_cells[0] is not None:
+        agent_cells = [level.agent_goal_cells[0]]
+    else:
+        occupied = set(boxes)
+        agent_cells = [cell for cell in range(level.num_cells) if not level.is_wall[cell] and cell not in occupied]
+    return [State(level, array('h', (cell,)), boxes[:]) for cell in agent_cells if cell not in boxes]
+
+def bidirectional_search(initial_state: 'State', goals: '[State, ...]', monitor: 'Monitor' = None) -> '[[Action, ...], ...]':
+    '''
+    Breadth-first search forwards from initial_state and backwards from goals (see goal_states) at the same time,
+    one layer at a time, always expanding the smaller of the two layers.
+    
+    Every action of a single agent can be undone (see INVERSE), so the predecessors of a state are exactly its
+    successors; the backward search uses the same expansion, and the plan is spliced from the forward path to
+    the meeting state and the inverted backward path from it to the goal. The layer in which the searches meet is
+    finished first, so that the shortest plan through any meeting state is returned.
+    '''
+    if monitor is None:
+        monitor = Monitor()
+    
+    print('Starting bidirectional breadth-first search from {:,} goal state(s).'.format(len(goals)), file=sys.stderr, flush=True)
+    
+    forward = {initial_state.key(): initial_state}
+    backward = {state.key(): state for state in goals}
+    forward_layer = [initial_state]
+    backward_layer = list(backward.values())
+    if initial_state.is_goal_state():
+        return []
+    explored = 0
+    monitor.start(None)
+    
+    try:
+        while forward_layer and backward_layer:
+            is_forward = len(forward_layer) <= len(backward_layer)
+            layer, reached, other = (forward_layer, forward, backward) if is_forward else (backward_layer, backward, forward)
+            next_layer = []
+            best = None
+            
+            for state in layer:
+                if monitor.tick(explored, len(forward) + len(backward)):
+                    monitor.report('memory')
+                    print('Maximum memory usage exceeded.', file=sys.stderr, flush=True)
+                    return None
+                explored += 1
+                
+                for joint_action, key in state.successors():
+                    if key in reached:
+                        continue
+                    child = state.apply_action(joint_action)
+                    reached[key] = child
+                    next_layer.append(child)
+                    
+                    meeting = other.get(key)
+                    if meeting is not None:
+                        pair = (child, meeting) if is_forward else (meeting, child)
+                    elif is_forward and child.is_goal_state():
+                        pair = (child, None)
+                    else:
+                        continue
+                    length = pair[0].g + (pair[1].g if pair[1] is not None else 0)
+                    if best is None or length < best[0]:
+                        best = (length, pair)
+            
+            if best is not None:
+                monitor.report('solved')
+                forward_state, backward_state = best[1]
+                plan = forward_state.extract_plan()
+                while backward_state is not None and backward_state.parent is not None:
+                    plan.append([INVERSE[action] for action in backward_state.joint_action])
+                    backward_state = backward_state.parent
+                return plan
+            
+            if is_forward:
+                forward_layer = next_layer
+            else:
+                backward_layer = next_layer
+        
+        monitor.report('exhausted')
+        return None
+    finally:
+        monitor.stop()
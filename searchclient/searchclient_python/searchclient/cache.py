@@ -0,0 +1,89 @@
+'''
+On-disk cache of level preprocessing, enabled with --cache-dir.
+
+The tables computed once per level from its static content are built through cached_array, and loaded from the
+cache instead whenever it holds them: the dead cells and action masks of Level, the distance tables of DistanceTable,
+the nearest-goal rows of Heuristic and the pair tables of PairDatabase.
+'''
+import hashlib
+import os
+from array import array
+
+# Changed whenever what is cached, or how, changes, so that entries written by older versions are never read.
+VERSION = 1
+
+# The cache directory, or None to disable the cache; set from --cache-dir.
+directory = None
+# The total size of the entries in bytes above which the least recently used are deleted; set from --cache-size.
+max_size = 256 * 1024 * 1024
+
+def level_key(level: 'Level') -> 'str':
+    '''
+    Returns a hash of the static content of level that the cached tables are computed from: its dimensions, walls,
+    goals and box letters. Levels with the same content share their entries, whatever their file names.
+    '''
+    digest = hashlib.sha256()
+    digest.update('{} {} {} {}\n'.format(VERSION, level.num_rows, level.num_cols, level.box_letters).encode('ascii'))
+    digest.update(level.is_wall)
+    digest.update(''.join(goal or ' ' for goal in level.goals).encode('ascii'))
+    return digest.hexdigest()
+
+def cached_array(level: 'Level', name: 'str', typecode: 'str', length: 'int', build) -> 'array':
+    '''
+    Returns the array named name for level from the cache, or else build(), which must return an array(typecode)
+    of the given length and is then stored. name must identify what build computes from the static content of level
+    (see level_key), e.g. 'dead-A'.
+    
+    Entries are the raw bytes of the arrays, one file per entry, so that loading one is a single read. Every load
+    touches the file, and the files modified longest ago are deleted once the entries exceed max_size.
+    The cache is best effort: entries that can not be read or written are computed instead.
+    '''
+    if directory is None:
+        return build()
+    
+    entry = hashlib.sha256('{} {} {}'.format(level_key(level), name, typecode).encode('ascii')).hexdigest()
+    path = os.path.join(directory, entry + '.bin')
+    try:
+        with open(path, 'rb') as entry_file:
+            table = array(typecode)
+            table.frombytes(entry_file.read())
+        if len(table) == length:
+            os.utime(path)
+            return table
+    except (OSError, ValueError):
+        pass
+    
+    table = build()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Written under a temporary name and renamed, so that other processes never read a partial entry.
+        temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary_path, 'wb') as entry_file:
+            table.tofile(entry_file)
+        os.replace(temporary_path, path)
+        evict()
+    except OSError:
+        pass
+    return table
+
+def evict():
+    '''
+    Deletes the least recently used entries until their total size is at most max_size.
+    '''
+    entries = []
+    for dir_entry in os.scandir(directory):
+        if dir_entry.name.endswith('.bin'):
+            try:
+                stat = dir_entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+    size = sum(entry_size for _, entry_size, _ in entries)
+    for _, entry_size, path in sorted(entries):
+        if size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        size -= entry_size
@@ -0,0 +1,33 @@
+from collections import deque
+
+def dead_cells(level: 'Level', goal_cells: '[int, ...]') -> 'bytearray':
+    '''
+    Returns a map with dead[cell] == 1 for every free cell from which a box can never be moved onto any of
+    goal_cells, considering only the static walls.
+    
+    A box can move from cell c to a neighbouring cell d if d is free and an agent can either push it, standing
+    on any other free neighbour of c, or pull it, stepping from d onto any other free neighbour of d; actions
+    may turn, so the agent need not be in line with the box. A box is thus only stuck where both c and d are
+    dead ends. The map is computed by a BFS backwards from the goals over these box moves.
+    Walls are never marked dead.
+    '''
+    is_wall = level.is_wall
+    live = bytearray(level.num_cells)
+    queue = deque()
+    for cell in goal_cells:
+        live[cell] = 1
+        queue.append(cell)
+    while queue:
+        destination = queue.popleft()
+        for cell in level.neighbours(destination):
+            if live[cell]:
+                continue
+            if len(level.neighbours(cell)) > 1 or len(level.neighbours(destination)) > 1:
+                live[cell] = 1
+                queue.append(cell)
+    
+    dead = bytearray(level.num_cells)
+    for cell in range(level.num_cells):
+        if not live[cell] and not is_wall[cell]:
+            dead[cell] = 1
+    return dead
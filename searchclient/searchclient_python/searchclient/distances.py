@@ -0,0 +1,56 @@
+from array import array
+from collections import deque
+
+import cache
+
+UNREACHABLE = 0xFFFF
+
+def bfs(level: 'Level', sources: '[int, ...]', neighbours: '[[int, ...], ...]' = None) -> 'array':
+    '''
+    Returns the number of moves from the nearest of the source cells to every cell of the level,
+    moving north, south, east and west over the static walls (agents and boxes are ignored).
+    Cells that cannot be reached hold UNREACHABLE.
+    '''
+    if neighbours is None:
+        neighbours = [level.neighbours(cell) for cell in range(level.num_cells)]
+    distances = array('H', [UNREACHABLE]) * level.num_cells
+    queue = deque()
+    for source in sources:
+        distances[source] = 0
+        queue.append(source)
+    while queue:
+        cell = queue.popleft()
+        distance = distances[cell] + 1
+        for neighbour in neighbours[cell]:
+            if distances[neighbour] == UNREACHABLE:
+                distances[neighbour] = distance
+                queue.append(neighbour)
+    return distances
+
+class DistanceTable:
+    def __init__(self, level: 'Level', sources: '[int, ...]'):
+        '''
+        Matrix of distances over the static walls with one row per source cell, built by a BFS from each source.
+        The rows are stored back to back in a single array('H'), so self.table[i * level.num_cells + cell] is the
+        distance between sources[i] and cell.
+        
+        self.neighbours, the neighbour lists the BFS used, is None if the table was loaded from the cache.
+        '''
+        self.sources = list(sources)
+        self.num_cells = level.num_cells
+        self.neighbours = None
+        name = 'distances-' + ','.join(str(source) for source in self.sources)
+        self.table = cache.cached_array(level, name, 'H', len(self.sources) * level.num_cells, lambda: self._build(level))
+    
+    def _build(self, level: 'Level') -> 'array':
+        self.neighbours = [level.neighbours(cell) for cell in range(level.num_cells)]
+        table = array('H')
+        for source in self.sources:
+            table.extend(bfs(level, [source], self.neighbours))
+        return table
+    
+    def row(self, index: 'int') -> 'memoryview':
+        '''
+        Returns the distances from sources[index] to every cell, without copying.
+        '''
+        return memoryview(self.table)[index * self.num_cells:(index + 1) * self.num_cells]
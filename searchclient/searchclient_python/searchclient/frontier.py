@@ -1,12 +1,17 @@
 from abc import ABCMeta, abstractmethod
 from collections import deque
+import heapq
 
 class Frontier(metaclass=ABCMeta):
+    '''
+    Frontiers hold the integer ids of nodes in a NodeStore (see nodestore.py). add is also given the node's state,
+    for frontiers that order nodes by evaluating it, but does not keep it.
+    '''
     @abstractmethod
-    def add(self, state: 'State'): raise NotImplementedError
+    def add(self, node: 'int', state: 'State'): raise NotImplementedError
     
     @abstractmethod
-    def pop(self) -> 'State': raise NotImplementedError
+    def pop(self) -> 'int': raise NotImplementedError
     
     @abstractmethod
     def is_empty(self) -> 'bool': raise NotImplementedError
@@ -14,26 +19,46 @@ class Frontier(metaclass=ABCMeta):
     @abstractmethod
     def size(self) -> 'int': raise NotImplementedError
     
-    @abstractmethod
-    def contains(self, state: 'State') -> 'bool': raise NotImplementedError
-    
     @abstractmethod
     def get_name(self): raise NotImplementedError
+    
+    def add_many(self, children: '[(int, State), ...]'):
+        '''
+        Adds every (node, state) pair of children, e.g. the new children of an expansion, in order.
+        '''
+        for node, state in children:
+            self.add(node, state)
+    
+    def update(self, node: 'int', state: 'State'):
+        '''
+        Called by the search when it has found a cheaper path to node, whose new g state has. Frontiers ordered by g
+        re-order node if it is still queued; nodes already expanded are not queued again.
+        '''
+        pass
+    
+    def shrink(self, store: 'NodeStore') -> '[int, ...]':
+        '''
+        Called by the search when memory is running low, or when is_full. Frontiers that can give up nodes to free
+        memory remove them and return them, so that the search forgets them and can generate them again later.
+        '''
+        return []
+    
+    def is_full(self) -> 'bool':
+        '''
+        Returns True if the frontier has grown past a capacity of its own, and should be shrunk regardless of memory.
+        '''
+        return False
 
 class FrontierBFS(Frontier):
     def __init__(self):
         super().__init__()
         self.queue = deque()
-        self.set = set()
     
-    def add(self, state: 'State'):
-        self.queue.append(state)
-        self.set.add(state)
+    def add(self, node: 'int', state: 'State'):
+        self.queue.append(node)
     
-    def pop(self) -> 'State':
-        state = self.queue.popleft()
-        self.set.remove(state)
-        return state
+    def pop(self) -> 'int':
+        return self.queue.popleft()
     
     def is_empty(self) -> 'bool':
         return len(self.queue) == 0
@@ -41,9 +66,6 @@ class FrontierBFS(Frontier):
     def size(self) -> 'int':
         return len(self.queue)
     
-    def contains(self, state: 'State') -> 'bool':
-        return state in self.set
-    
     def get_name(self):
         return 'breadth-first search'
 
@@ -52,10 +74,10 @@ class FrontierDFS(Frontier):
         super().__init__()
         raise NotImplementedError
     
-    def add(self, state: 'State'):
+    def add(self, node: 'int', state: 'State'):
         raise NotImplementedError
     
-    def pop(self) -> 'State':
+    def pop(self) -> 'int':
         raise NotImplementedError
     
     def is_empty(self) -> 'bool':
@@ -64,32 +86,239 @@ class FrontierDFS(Frontier):
     def size(self) -> 'int':
         raise NotImplementedError
     
-    def contains(self, state: 'State') -> 'bool':
-        raise NotImplementedError
-    
     def get_name(self):
         return 'depth-first search'
 
 class FrontierBestFirst(Frontier):
-    def __init__(self, heuristic: 'Heuristic'):
+    TIE_BREAKING = ('g-high', 'h-low', 'fifo', 'lifo')
+    
+    def __init__(self, heuristic: 'Heuristic', tie_breaking: 'str' = 'g-high'):
+        '''
+        Priority queue of nodes ordered by heuristic.f of their states, backed by a binary heap.
+        
+        Nodes with equal f are ordered by tie_breaking:
+            'g-high': prefer the node with the highest g (deepest), then FIFO.
+            'h-low':  prefer the node with the lowest h, then FIFO. f is then computed from h (see
+                      Heuristic.f_from_h), so h is still evaluated once per added node, in batches by add_many.
+            'fifo':   prefer the node added first.
+            'lifo':   prefer the node added last.
+        
+        Adding a node that is already in the frontier replaces its entry (decrease-key); callers only do so when
+        they have found a cheaper path to it. The replaced heap entry is not removed, but skipped when it reaches
+        the top of the heap (lazy deletion).
+        '''
         super().__init__()
+        if tie_breaking not in FrontierBestFirst.TIE_BREAKING:
+            raise ValueError('Unknown tie-breaking policy: {}.'.format(tie_breaking))
         self.heuristic = heuristic
-        raise NotImplementedError
+        self.tie_breaking = tie_breaking
+        self.heap = []
+        self.entries = {}
+        self.count = 0
     
-    def add(self, state: 'State'):
-        raise NotImplementedError
+    def add(self, node: 'int', state: 'State'):
+        if self.tie_breaking == 'h-low':
+            h = self.heuristic.h(state)
+            self.add_evaluated(node, state, self.heuristic.f_from_h(state, h), h)
+        else:
+            self.add_evaluated(node, state, self.heuristic.f(state))
     
-    def pop(self) -> 'State':
-        raise NotImplementedError
+    def add_many(self, children: '[(int, State), ...]'):
+        # Evaluated in one batch, see Heuristic.h_many.
+        states = [state for _, state in children]
+        if self.tie_breaking == 'h-low':
+            for (node, state), h in zip(children, self.heuristic.h_many(states)):
+                self.add_evaluated(node, state, self.heuristic.f_from_h(state, h), h)
+        else:
+            for (node, state), f in zip(children, self.heuristic.f_many(states)):
+                self.add_evaluated(node, state, f)
+    
+    def update(self, node: 'int', state: 'State'):
+        if node in self.entries:
+            self.add(node, state)
+    
+    def add_evaluated(self, node: 'int', state: 'State', f: 'int', h: 'int' = None):
+        '''
+        Adds node with f already known, e.g. computed from cached values of h (see SearchClient.anytime_search).
+        h is only used by 'h-low', which evaluates it if it is not given.
+        '''
+        self.count += 1
+        if self.tie_breaking == 'g-high':
+            entry = (f, -state.g, self.count, node)
+        elif self.tie_breaking == 'h-low':
+            entry = (f, self.heuristic.h(state) if h is None else h, self.count, node)
+        elif self.tie_breaking == 'fifo':
+            entry = (f, self.count, node)
+        else:
+            entry = (f, -self.count, node)
+        
+        self.entries[node] = entry
+        heapq.heappush(self.heap, entry)
+    
+    def pop(self) -> 'int':
+        return self.pop_entry()[-1]
+    
+    def pop_entry(self) -> 'tuple':
+        '''
+        Removes and returns the heap entry of the next node, whose first item is its f and last its id.
+        '''
+        while True:
+            entry = heapq.heappop(self.heap)
+            # Skip entries replaced by a later add of the same node.
+            if self.entries.get(entry[-1]) is entry:
+                del self.entries[entry[-1]]
+                return entry
     
     def is_empty(self) -> 'bool':
-        raise NotImplementedError
+        return len(self.entries) == 0
     
     def size(self) -> 'int':
-        raise NotImplementedError
-    
-    def contains(self, state: 'State') -> 'bool':
-        raise NotImplementedError
+        return len(self.entries)
     
     def get_name(self):
         return 'best-first search using {}'.format(self.heuristic)
+
+class FrontierMemoryBounded(FrontierBestFirst):
+    # The least number of nodes the frontier is capped at, so that a search started close to the memory limit is not
+    # left with too few nodes to make progress. Past that, the search fails once memory runs out.
+    MIN_CAPACITY = 1000
+    
+    def __init__(self, heuristic: 'Heuristic', tie_breaking: 'str' = 'g-high', capacity: 'int' = None):
+        '''
+        Best-first frontier that drops its worst states when memory runs low, a simplified form of SMA*
+        (R&N section 3.5.3).
+        
+        The first call to shrink caps the frontier at 3/4 of its size at that point, but at least MIN_CAPACITY,
+        unless a capacity is given, which caps it from the start (e.g. to test dropping nodes on small levels).
+        Whenever it has grown past the cap, shrink drops the nodes with the highest f (ties broken as in
+        FrontierBestFirst) down to 3/4 of the cap, so that nodes are dropped in batches rather than one per
+        expansion. Expanded nodes added back by shrink (see below) do not count against the cap, since the NodeStore
+        keeps them either way. If the frontier never grows past the cap, nothing is dropped, and the search stops as
+        usual once memory.max_usage is exceeded.
+        
+        The nearest ancestor of each dropped node that is neither forgotten nor about to be dropped is added back,
+        even if it was expanded already, with the lowest f of the dropped nodes below it (the backed-up value), so
+        the dropped nodes are generated again once that f is reached. An expanded ancestor gets at least its own f,
+        and one still in the frontier keeps its f if that is lower. An expanded ancestor whose children are all
+        forgotten is dropped as well, and its backed-up value passed on to its own nearest ancestor, as in SMA*.
+        Nodes without such an ancestor, like the root, are never dropped, since nothing would generate them again.
+        The search must forget the dropped nodes for this, see SearchClient.search.
+        
+        The f of a child is at least the f its parent was popped with (pathmax), so that nodes generated again below
+        an ancestor keep its backed-up value instead of their own lower f. Without this, the same nodes could be
+        dropped and generated again with the same f forever.
+        
+        Only the frontier is bounded: expanded nodes are kept in the NodeStore as long as any of their children are,
+        so the memory they take grows with the search, and the search can still run out of memory. Nor does memory
+        freed by dropping nodes lower the usage the search is stopped on, since Python keeps it for new nodes rather
+        than returning it to the OS.
+        
+        A backed-up f only bounds the plans through the nodes generated below the ancestor, not through states that
+        were reached along other paths first, so a state can be expanded before the cheaper path to it is generated
+        again. Such a state takes the cheaper path once its children are all forgotten (see update), but keeps its
+        record as long as it has children, since the nodes dropped below it are generated again from that record.
+        So unlike A*, this search does not always return a shortest plan, even with a consistent heuristic, and the
+        smaller the cap, the longer the plans tend to be.
+        '''
+        super().__init__(heuristic, tie_breaking)
+        self.capacity = capacity
+        # The f of the node popped last, the parent of the nodes added until the next pop.
+        self.parent_f = 0
+        # The expanded nodes added back by shrink that are still in the frontier.
+        self.requeued = set()
+    
+    def pop_entry(self) -> 'tuple':
+        entry = super().pop_entry()
+        self.parent_f = entry[0]
+        self.requeued.discard(entry[-1])
+        return entry
+    
+    def add_evaluated(self, node: 'int', state: 'State', f: 'int', h: 'int' = None):
+        super().add_evaluated(node, state, max(f, self.parent_f), h)
+    
+    def shrink(self, store: 'NodeStore') -> '[int, ...]':
+        if self.capacity is None:
+            self.capacity = max(FrontierMemoryBounded.MIN_CAPACITY, len(self.entries) * 3 // 4)
+        if not self.is_full():
+            return []
+        
+        keep = self.capacity * 3 // 4
+        
+        def surviving_ancestor(node: 'int') -> 'int':
+            # Forgotten ancestors, and nodes dropped in this batch (which the search will forget), are skipped for the
+            # nearest one that survives, so that only nodes the search still knows are added back.
+            ancestor = store.parents[node]
+            while ancestor != store.NONE and (ancestor in gone or not store.is_reached(ancestor)):
+                ancestor = store.parents[ancestor]
+            return ancestor
+        
+        def back_up(ancestor: 'int', f: 'int'):
+            if ancestor not in backed_up or f < backed_up[ancestor]:
+                backed_up[ancestor] = f
+        
+        # Back up the lowest f of the dropped nodes below each ancestor, worst nodes first. Nodes without an ancestor
+        # are kept, and the next worst are dropped instead. A node dropped after nodes below it passes their
+        # backed-up value on.
+        gone = set()
+        dropped = []
+        backed_up = {}
+        # The number of children of each node that are freed once the dropped nodes are forgotten.
+        freed = {}
+        for entry in sorted(self.entries.values(), reverse=True):
+            if len(self.entries) - len(self.requeued) <= keep:
+                break
+            node = entry[-1]
+            ancestor = surviving_ancestor(node)
+            if ancestor == store.NONE:
+                continue
+            del self.entries[node]
+            self.requeued.discard(node)
+            gone.add(node)
+            dropped.append(node)
+            if store.children[node] == 0:
+                freed[store.parents[node]] = freed.get(store.parents[node], 0) + 1
+            back_up(ancestor, min(entry[0], backed_up.pop(node, entry[0])))
+        
+        # Drop expanded ancestors all of whose children are freed, deepest first, and pass their backed-up values up.
+        pending = [(-store.g[node], node) for node in backed_up]
+        heapq.heapify(pending)
+        while pending:
+            node = heapq.heappop(pending)[-1]
+            if node in self.entries or freed.get(node, 0) < store.children[node]:
+                continue
+            gone.add(node)
+            ancestor = surviving_ancestor(node)
+            if ancestor == store.NONE:
+                gone.discard(node)
+                continue
+            dropped.append(node)
+            freed[store.parents[node]] = freed.get(store.parents[node], 0) + 1
+            f = backed_up.pop(node)
+            if ancestor not in backed_up:
+                heapq.heappush(pending, (-store.g[ancestor], ancestor))
+            back_up(ancestor, f)
+        
+        # Queue the ancestors to generate the dropped nodes again. Not through add_evaluated, whose pathmax only
+        # applies to the children of the node popped last.
+        self.heap = list(self.entries.values())
+        heapq.heapify(self.heap)
+        for ancestor, f in backed_up.items():
+            state = store.state(ancestor)
+            if ancestor in self.entries:
+                if f < self.entries[ancestor][0]:
+                    super().add_evaluated(ancestor, state, f)
+            else:
+                super().add_evaluated(ancestor, state, max(f, self.heuristic.f(state)))
+                self.requeued.add(ancestor)
+        
+        return dropped
+    
+    def is_full(self) -> 'bool':
+        return self.capacity is not None and len(self.entries) - len(self.requeued) > self.capacity
+    
+    def update(self, node: 'int', state: 'State'):
+        # An expanded node whose children were all dropped is queued again with the cheaper path.
+        self.add(node, state)
+    
+    def get_name(self):
+        return 'memory-bounded best-first search using {}'.format(self.heuristic)
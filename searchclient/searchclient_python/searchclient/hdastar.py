@@ -0,0 +1,322 @@
+import io
+import multiprocessing
+import queue
+import sys
+
+import psutil
+
+import memory
+from action import Action
+from frontier import FrontierBestFirst
+from heuristic import HeuristicAStar
+from monitor import Monitor
+from nodestore import NodeStore
+from state import State
+
+ACTIONS = list(Action)
+ACTION_INDEX = {action: index for index, action in enumerate(ACTIONS)}
+# Seconds the master waits for a message before checking that the workers are still running.
+POLL_INTERVAL = 1.0
+
+class HDAWorker:
+    '''
+    One process of hash-distributed A* (HDA*, Kishimoto, Fukunaga and Botea 2009).
+    
+    Every state is owned by worker state.__hash__() % count; its Zobrist hash is the same in every process, since
+    the keys are drawn from a fixed seed. A worker runs A* with its own FrontierBestFirst over the states it owns:
+    successors owned by other workers are buffered and sent to them in batches of BATCH nodes, as
+    (key, g, parent key, action indices, unsatisfied goals). Incoming nodes are only queued if they improve the best g known for
+    their key, so duplicate detection happens at the owner.
+    
+    Successors are generated as keys, and the owner of each is found by updating the hash of the expanded state with
+    the moved agents and boxes (see State.child_hash), so that a child state is only created if it is sent to another
+    worker, or if it is owned by this one and improves on the best g known for it.
+    
+    A worker interns the states it owns in a NodeStore, which holds their best g, and records the (parent key,
+    parent owner, action indices) of the best path to each, so that the plan can be traced back across workers
+    once the search is over.
+    
+    Each worker reports its own progress and samples its own memory usage with monitor, against its share of the
+    memory limit; once that is exceeded, it drops its frontier and waits to be stopped.
+    
+    Messages to a worker:
+        ('nodes', sender, [(key, g, parent key, actions, unsatisfied), ...])
+        ('incumbent', cost): a plan of this cost has been found; states with f >= cost can be dropped.
+        ('probe', round):    reply with the worker's idle flag and message counters.
+        ('trace', key):      reply with the parent key, parent owner and actions recorded for key.
+        ('stop',)
+    Messages to the master:
+        ('idle', worker, sent, received, expanded) whenever the worker runs out of work.
+        ('solution', worker, cost, key) for every goal state that improves on the incumbent.
+        ('probe', round, worker, idle, sent, received, expanded)
+        ('trace', parent key, parent owner, actions)
+        ('memory', worker) when the worker exceeds its memory limit (see Monitor.tick).
+    '''
+    BATCH = 256
+    EXPANSIONS = 64
+    
+    def __init__(self, index: 'int', inboxes: '[multiprocessing.Queue, ...]', master: 'multiprocessing.Queue', initial_state: 'State', heuristic: 'Heuristic', tie_breaking: 'str', shuffle: 'bool' = False, monitor: 'Monitor' = None):
+        self.index = index
+        self.count = len(inboxes)
+        self.inboxes = inboxes
+        self.inbox = inboxes[index]
+        self.master = master
+        self.heuristic = heuristic
+        self.tie_breaking = tie_breaking
+        self.shuffle = shuffle
+        self.monitor = monitor if monitor is not None else Monitor()
+        self.frontier = FrontierBestFirst(heuristic, tie_breaking)
+        self.store = NodeStore(initial_state)
+        self.paths = {}
+        self.buffers = [[] for _ in inboxes]
+        self.incumbent = None
+        self.sent = 0
+        self.received = 0
+        self.expanded = 0
+        
+        if initial_state.__hash__() % self.count == index:
+            self.insert(initial_state.key(), 0, None, None, None, initial_state.unsatisfied_goals(), initial_state)
+    
+    def run(self):
+        self.monitor.start(self.frontier)
+        idle_reported = False
+        while True:
+            if self.frontier.is_empty():
+                self.flush()
+                if not idle_reported:
+                    self.master.put(('idle', self.index, self.sent, self.received, self.expanded))
+                    idle_reported = True
+                message = self.inbox.get()
+            else:
+                try:
+                    message = self.inbox.get_nowait()
+                except queue.Empty:
+                    message = None
+            
+            if message is not None:
+                kind = message[0]
+                if kind == 'nodes':
+                    self.received += 1
+                    _, sender, nodes = message
+                    for key, g, parent_key, actions, unsatisfied in nodes:
+                        self.insert(key, g, parent_key, sender, actions, unsatisfied)
+                    idle_reported = False
+                elif kind == 'incumbent':
+                    if self.incumbent is None or message[1] < self.incumbent:
+                        self.incumbent = message[1]
+                elif kind == 'probe':
+                    idle = self.frontier.is_empty() and not any(self.buffers)
+                    self.master.put(('probe', message[1], self.index, idle, self.sent, self.received, self.expanded))
+                elif kind == 'trace':
+                    parent_key, parent_owner, actions = self.paths[self.store.find(message[1])]
+                    self.master.put(('trace', parent_key, parent_owner, actions))
+                elif kind == 'stop':
+                    self.monitor.stop()
+                    return
+                # Handle all pending messages before expanding.
+                continue
+            
+            for _ in range(HDAWorker.EXPANSIONS):
+                if self.frontier.is_empty():
+                    break
+                self.expand(self.frontier.pop())
+            idle_reported = False
+    
+    def insert(self, key: 'bytes', g: 'int', parent_key: 'bytes', parent_owner: 'int', actions: '(int, ...)', unsatisfied: 'int', state: 'State' = None):
+        node = self.store.find(key)
+        if node is None:
+            node = self.store.add(key, NodeStore.NONE, None, g, unsatisfied)
+        elif self.store.g[node] <= g:
+            return
+        else:
+            # A cheaper path: the frontier replaces the node's entry, or queues it again if it was expanded.
+            self.store.update(node, NodeStore.NONE, None, g)
+        self.paths[node] = (parent_key, parent_owner, actions)
+        if state is None:
+            state = self.store.state(node)
+        self.frontier.add(node, state)
+    
+    def expand(self, node: 'int'):
+        state = self.store.state(node)
+        key = self.store.keys[node]
+        
+        if state.is_goal_state():
+            if self.incumbent is None or state.g < self.incumbent:
+                self.incumbent = state.g
+                self.master.put(('solution', self.index, state.g, key))
+            return
+        
+        if self.incumbent is not None and self.heuristic.f(state) >= self.incumbent:
+            # The frontier is ordered by f, so nothing left in it can improve on the incumbent.
+            self.clear()
+            return
+        
+        self.expanded += 1
+        if self.monitor.tick(self.expanded, len(self.store)):
+            self.monitor.report('memory')
+            self.master.put(('memory', self.index))
+            self.clear()
+            return
+        
+        child_g = state.child_g()
+        for joint_action, child_key in state.successors(self.shuffle):
+            owner = state.child_hash(joint_action) % self.count
+            if owner == self.index:
+                node = self.store.find(child_key)
+                if node is not None and self.store.g[node] <= child_g:
+                    continue
+            child = state.apply_action(joint_action)
+            actions = tuple(ACTION_INDEX[action] for action in joint_action)
+            if owner == self.index:
+                self.insert(child_key, child.g, key, self.index, actions, child.unsatisfied_goals(), child)
+            else:
+                buffer = self.buffers[owner]
+                buffer.append((child_key, child.g, key, actions, child.unsatisfied_goals()))
+                if len(buffer) >= HDAWorker.BATCH:
+                    self.send(owner)
+    
+    def clear(self):
+        self.frontier = FrontierBestFirst(self.heuristic, self.tie_breaking)
+        self.monitor.frontier = self.frontier
+    
+    def send(self, owner: 'int'):
+        self.inboxes[owner].put(('nodes', self.index, self.buffers[owner]))
+        self.buffers[owner] = []
+        self.sent += 1
+    
+    def flush(self):
+        for owner, buffer in enumerate(self.buffers):
+            if buffer:
+                self.send(owner)
+
+def _run_worker(index: 'int', inboxes: '[multiprocessing.Queue, ...]', master: 'multiprocessing.Queue', level_text: 'str', parse_level, method: 'str', tie_breaking: 'str', max_usage: 'float', shuffle: 'int', monitor_settings: '(str, float, str)'):
+    # The process object inherited from the master would report the master's memory.
+    memory._process = psutil.Process()
+    memory.max_usage = max_usage
+    if shuffle is not None:
+        State._RNG.seed(shuffle)
+    initial_state = parse_level(io.StringIO(level_text))
+    HDAWorker(index, inboxes, master, initial_state, HeuristicAStar(initial_state, method), tie_breaking, shuffle is not None, Monitor(*monitor_settings)).run()
+
+def hda_star_search(level_text: 'str', parse_level, count: 'int', method: 'str' = 'distance', tie_breaking: 'str' = 'g-high', shuffle: 'int' = None, monitor_settings: '(str, float, str)' = ('iterations', None, 'text')) -> '[[Action, ...], ...]':
+    '''
+    Runs HDA* in count worker processes over the level in level_text, parsed in each worker by parse_level,
+    using HeuristicAStar(method). memory.max_usage is divided evenly between the workers.
+    
+    If shuffle is not None, the workers generate successors in a random order seeded with it. Each worker has its
+    own Monitor(*monitor_settings), i.e. (mode, interval, format).
+    
+    The first plan found becomes the incumbent and is broadcast; the search continues until no worker can
+    improve on it, so the plan returned is optimal if the heuristic is admissible.
+    
+    Termination is detected by counting 'nodes' messages: once every worker has reported idle and the sums of
+    sent and received messages agree, every worker is probed, and the search is over only if all are still idle
+    with unchanged counters. The plan is then traced back by asking the owner of each state on it for its parent.
+    
+    Workers only exit when they are stopped, so if one exits before (e.g. killed by the OS for its memory), the
+    search is abandoned and None is returned.
+    '''
+    context = multiprocessing.get_context()
+    inboxes = [context.Queue() for _ in range(count)]
+    master = context.Queue()
+    workers = [context.Process(target=_run_worker, args=(index, inboxes, master, level_text, parse_level, method, tie_breaking, memory.max_usage / count, shuffle, monitor_settings), daemon=True) for index in range(count)]
+    for worker in workers:
+        worker.start()
+    
+    print('Starting HDA* with {} workers using A* evaluation ({}).'.format(count, method), file=sys.stderr, flush=True)
+    
+    incumbent = None
+    solution = None
+    idle = {}
+    probe_round = 0
+    
+    def receive() -> 'tuple':
+        '''
+        Returns the next message to the master, or None if a worker has exited.
+        '''
+        while True:
+            try:
+                return master.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                for index, worker in enumerate(workers):
+                    if worker.exitcode is not None:
+                        print('HDA* worker {} exited with code {}; stopping the search.'.format(index, worker.exitcode), file=sys.stderr, flush=True)
+                        return None
+    
+    def handle(message) -> 'bool':
+        '''
+        Handles a solution, idle or memory message; returns False if the search must stop.
+        '''
+        nonlocal incumbent, solution
+        kind = message[0]
+        if kind == 'solution':
+            _, worker, cost, key = message
+            if incumbent is None or cost < incumbent:
+                incumbent = cost
+                solution = (worker, key)
+                print('Found plan of length {}; searching for shorter ones.'.format(cost), file=sys.stderr, flush=True)
+                for inbox in inboxes:
+                    inbox.put(('incumbent', cost))
+        elif kind == 'idle':
+            idle[message[1]] = message[2:]
+        elif kind == 'memory':
+            print('Maximum memory usage exceeded.', file=sys.stderr, flush=True)
+            return False
+        return True
+    
+    try:
+        reported = None
+        while True:
+            # Wait until every worker has reported idle and no nodes are in flight, unless reports changed during the
+            # last probe round, so that nothing may arrive to trigger a new one.
+            if reported == idle or len(idle) < count or sum(sent for sent, _, _ in idle.values()) != sum(received for _, received, _ in idle.values()):
+                message = receive()
+                if message is None or not handle(message):
+                    return None
+                continue
+            
+            # Confirm that nothing has happened since the reports.
+            reported = dict(idle)
+            probe_round += 1
+            for inbox in inboxes:
+                inbox.put(('probe', probe_round))
+            replies = {}
+            while len(replies) < count:
+                message = receive()
+                if message is None:
+                    return None
+                if message[0] == 'probe':
+                    if message[1] == probe_round:
+                        _, _, worker, worker_idle, sent, received, expanded = message
+                        replies[worker] = (worker_idle, (sent, received, expanded))
+                elif not handle(message):
+                    return None
+            if all(worker_idle and counters == reported[worker] for worker, (worker_idle, counters) in replies.items()):
+                break
+        
+        print('HDA* finished after {:,} expansions.'.format(sum(expanded for _, _, expanded in idle.values())), file=sys.stderr, flush=True)
+        if solution is None:
+            return None
+        
+        # Trace the plan back from the goal, asking the owner of each state for its parent.
+        plan = []
+        owner, key = solution
+        while True:
+            inboxes[owner].put(('trace', key))
+            message = receive()
+            if message is None:
+                return None
+            _, parent_key, parent_owner, actions = message
+            if parent_key is None:
+                break
+            plan.append([ACTIONS[action] for action in actions])
+            owner, key = parent_owner, parent_key
+        plan.reverse()
+        return plan
+    finally:
+        for inbox in inboxes:
+            inbox.put(('stop',))
+        for worker in workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
@@ -1,46 +1,395 @@
+import importlib.util
 from abc import ABCMeta, abstractmethod
 
+import cache
+from distances import DistanceTable, bfs
+from patterns import box_groups, pairings
+
+# NumPy is optional, and only used if enabled with --numpy (see Heuristic.h_many): importing it takes about 16 MB,
+# more memory than many whole searches. It is then imported by the first batch that uses it.
+HAVE_NUMPY = importlib.util.find_spec('numpy') is not None
+numpy = None
+# Whether Heuristic.h_many may use NumPy (set from --numpy).
+use_numpy = False
+
 class Heuristic(metaclass=ABCMeta):
-    def __init__(self, initial_state: 'State'):
-        # Here's a chance to pre-process the static parts of the level.
-        pass
+    METHODS = ('goal-count', 'distance', 'matching', 'pdb')
+    # Rough costs of h_many in table lookups made in Python: a state costs PYTHON_STATE_COST on top of its own
+    # lookups, and a NumPy batch of any size costs NUMPY_BATCH_COST[method]. Batches are evaluated with NumPy when
+    # that is cheaper, which on small batches and levels with few boxes it is not.
+    PYTHON_STATE_COST = 13
+    NUMPY_BATCH_COST = {'distance': 100, 'pdb': 330}
+    
+    def __init__(self, initial_state: 'State', method: 'str' = 'distance'):
+        '''
+        Pre-processes the static parts of the level once, so that h only does table lookups.
+        
+        The method selects the estimate returned by h:
+            'goal-count': the number of unsatisfied goals.
+            'distance':   the sum over boxes of the distance to the nearest goal of the same letter; for letters
+                          with more boxes than goals, the minimum cost of assigning its goals to distinct boxes of
+                          the letter instead, as in 'matching'. O(boxes + agents) per state, and O(goals^2 * boxes)
+                          per letter with more boxes than goals.
+            'matching':   like 'distance', but boxes of each letter are assigned to distinct goals of that letter
+                          by a minimum-cost bipartite matching, so boxes without a goal of their own are free.
+                          O(boxes^3) per state.
+            'pdb':        like 'distance', but the boxes of each letter with a few boxes are paired up in the way
+                          that gives the fewest moves, where each pair counts the larger of the distances of its
+                          boxes and the number of box moves that solves the pair on its own, looked up in a pattern
+                          database (see patterns.py). O(agents + boxes * pairings) per state, with up to 15
+                          pairings of a letter.
+        Each of these box terms is a lower bound on the number of box moves left, and a box move lowers it by at most
+        one. (Summing the distance to the nearest box over the goals would not do: one move of a box that is nearest
+        to two goals lowers it by two.) A joint action moves at most one box per agent, and every agent by at most one
+        cell, so 'distance', 'matching' and 'pdb' return the larger of the box term divided by the number of agents,
+        and the largest distance of an agent to its goal. Both bound the plan length from below and drop by at most
+        one per joint action, so these methods are consistent and -astar returns shortest plans. 'goal-count' is not:
+        a single action can satisfy both the goal of its agent and the goal of a box.
+        Distances are measured over the static walls only, so they ignore agents and boxes in the way.
+        '''
+        if method not in Heuristic.METHODS:
+            raise ValueError('Unknown heuristic: {}.'.format(method))
+        self.method = method
+        level = initial_state.level
+        self.num_agents = len(initial_state.agents)
+        
+        self.box_goals = [(cell, goal) for cell, goal in level.goal_cells if 'A' <= goal <= 'Z']
+        self.agent_goals = [(ord(goal) - ord('0'), cell) for cell, goal in level.goal_cells if '0' <= goal <= '9']
+        
+        # One row of distances per goal cell.
+        self.goal_distances = DistanceTable(level, [cell for cell, _ in level.goal_cells])
+        goal_rows = {cell: self.goal_distances.row(index) for index, cell in enumerate(self.goal_distances.sources)}
+        self.agent_rows = [(agent, goal_rows[cell]) for agent, cell in self.agent_goals]
+        
+        # For each letter with goals, the range of its box numbers and the distance rows of its goals.
+        self.box_groups = []
+        for start, end in sorted(set(level.box_groups)):
+            rows = [goal_rows[cell] for cell, goal in self.box_goals if goal == level.box_letters[start]]
+            if rows:
+                self.box_groups.append((start, end, rows))
+        
+        # For each box whose letter has goals for all its boxes, the distance to the nearest goal of that letter. Not
+        # every box of a letter with more boxes than goals needs to move, so those letters are kept as surplus groups
+        # instead, and their goals are assigned to distinct boxes (see surplus_moves).
+        nearest = {}
+        self.surplus_groups = []
+        for start, end, rows in self.box_groups:
+            letter = level.box_letters[start]
+            if len(rows) < end - start:
+                self.surplus_groups.append((start, end, rows))
+            else:
+                goal_cells = [cell for cell, goal in self.box_goals if goal == letter]
+                nearest[letter] = cache.cached_array(level, 'nearest-' + letter, 'H', level.num_cells, lambda: bfs(level, goal_cells, self.goal_distances.neighbours))
+        self.box_rows = [(box, nearest[letter]) for box, letter in enumerate(level.box_letters) if letter in nearest]
+        
+        # For 'pdb', every pair of boxes of a letter that is paired, the ways to pair up each such letter, and the
+        # distance rows of the other boxes. Each way is (positions in box_pairs, (box, row) of the box left single).
+        # The databases are built once per level, and shared by every heuristic over it.
+        self.box_pairs = []
+        self.pair_groups = []
+        self.single_rows = []
+        if method == 'pdb':
+            groups, singles = box_groups(level)
+            rows = dict(self.box_rows)
+            for boxes, database in groups:
+                positions = {}
+                for position, box1 in enumerate(boxes):
+                    for box2 in boxes[position + 1:]:
+                        positions[(box1, box2)] = len(self.box_pairs)
+                        self.box_pairs.append((box1, box2, database.index1, database.index2, database.width, database.table, rows[box1], rows[box2]))
+                self.pair_groups.append([(tuple(positions[pair] for pair in pairs), tuple((box, rows[box]) for box in single)) for pairs, single in pairings(boxes)])
+            self.single_rows = [(box, rows[box]) for box in singles if box in rows]
+        
+        # The lookups of h per state (a pair counts as three, a way to pair up a letter as one) that h_many can make
+        # with NumPy, and the NumPy copies of the tables used by h_many, made on its first batch. Surplus groups are
+        # assigned in Python either way.
+        if method == 'pdb':
+            self._lookups = len(self.agent_rows) + len(self.single_rows) + 3 * len(self.box_pairs) + sum(len(ways) for ways in self.pair_groups)
+        else:
+            self._lookups = len(self.agent_rows) + len(self.box_rows)
+        self._arrays = None
+        
+        if method == 'goal-count':
+            self._h = self.h_goal_count
+        elif method == 'distance':
+            self._h = self.h_distance
+        elif method == 'matching':
+            self._h = self.h_matching
+        else:
+            self._h = self.h_pdb
     
     def h(self, state: 'State') -> 'int':
-        raise NotImplementedError
+        return self._h(state)
+    
+    def h_many(self, states: '[State, ...]') -> '[int, ...]':
+        '''
+        Returns h of every state in states, e.g. of all the children of an expansion.
+        
+        For 'distance' and 'pdb', if NumPy is enabled (see use_numpy) and the batch is large enough (see
+        NUMPY_BATCH_COST), the cells of the agents and boxes of all states are gathered into matrices with one row per
+        state, looked up in the distance and pattern tables at once, and combined per row as in h; the surplus groups
+        are still assigned state by state. Otherwise, h is evaluated state by state.
+        '''
+        if not use_numpy or self.method not in Heuristic.NUMPY_BATCH_COST or len(states) * (Heuristic.PYTHON_STATE_COST + self._lookups) < Heuristic.NUMPY_BATCH_COST[self.method]:
+            return [self._h(state) for state in states]
+        if self._arrays is None:
+            self._arrays = self._numpy_arrays()
+        agent_ids, agent_table, box_ids, box_table, pairs = self._arrays
+        
+        count = len(states)
+        if self.surplus_groups:
+            h = numpy.array([self.surplus_moves(state.boxes) for state in states], dtype=numpy.int64)
+        else:
+            h = numpy.zeros(count, dtype=numpy.int64)
+        if box_ids is not None or pairs is not None:
+            boxes = numpy.frombuffer(b''.join([state.boxes.tobytes() for state in states]), dtype=numpy.int16).reshape(count, -1)
+        if box_ids is not None:
+            h += box_table[numpy.arange(len(box_ids)), boxes[:, box_ids]].sum(axis=1)
+        if pairs is not None:
+            boxes1, boxes2, rows1, rows2, index1, index2, widths, offsets, tables, way_pairs, way_boxes, way_rows, way_singles, group_starts = pairs
+            pair = numpy.arange(len(boxes1))
+            cells1 = boxes[:, boxes1]
+            cells2 = boxes[:, boxes2]
+            distance = rows1[pair, cells1] + rows2[pair, cells2]
+            positions1 = index1[pair, cells1]
+            positions2 = index2[pair, cells2]
+            valid = (positions1 >= 0) & (positions2 >= 0)
+            cost = numpy.where(valid, tables[numpy.where(valid, offsets + positions1 * widths + positions2, 0)], 0)
+            # One column per way to pair up a letter, and the least of the ways of each letter.
+            ways = numpy.maximum(distance, cost) @ way_pairs
+            if way_boxes is not None:
+                ways += way_rows[numpy.arange(len(way_boxes)), boxes[:, way_boxes]] @ way_singles
+            h += numpy.minimum.reduceat(ways, group_starts, axis=1).sum(axis=1)
+        
+        h = -(-h // self.num_agents)
+        if agent_ids is not None:
+            agents = numpy.frombuffer(b''.join([state.agents.tobytes() for state in states]), dtype=numpy.int16).reshape(count, -1)
+            h = numpy.maximum(h, agent_table[numpy.arange(len(agent_ids)), agents[:, agent_ids]].max(axis=1))
+        return h.tolist()
+    
+    def _numpy_arrays(self) -> 'tuple':
+        '''
+        Returns the tables of h_many: the agents with goals and their distance rows, the boxes looked up by distance
+        alone and their rows, and for 'pdb' the pairs, as arrays with one entry or row per pair. Each distinct pattern
+        database is stored once in the concatenated tables, at offsets[pair] for the pairs that share it. The ways to
+        pair up the letters are 0/1 matrices with a column per way, over the pairs and over the boxes left single,
+        with the columns of each letter starting at group_starts.
+        '''
+        global numpy
+        if numpy is None:
+            import numpy
+        
+        def stack(rows):
+            return numpy.array([numpy.frombuffer(row, dtype=numpy.uint16) for row in rows], dtype=numpy.int64)
+        
+        agent_ids = agent_table = box_ids = box_table = pairs = None
+        if self.agent_rows:
+            agent_ids = numpy.array([agent for agent, _ in self.agent_rows])
+            agent_table = stack([row for _, row in self.agent_rows])
+        single_rows = self.box_rows if self.method == 'distance' else self.single_rows
+        if single_rows:
+            box_ids = numpy.array([box for box, _ in single_rows])
+            box_table = stack([row for _, row in single_rows])
+        if self.box_pairs:
+            boxes1, boxes2, index1, index2, widths, tables, rows1, rows2 = zip(*self.box_pairs)
+            offsets = {}
+            distinct = []
+            for table in tables:
+                if id(table) not in offsets:
+                    offsets[id(table)] = sum(len(previous) for previous in distinct)
+                    distinct.append(table)
+            pairs = (
+                numpy.array(boxes1),
+                numpy.array(boxes2),
+                stack(rows1),
+                stack(rows2),
+                numpy.array([numpy.frombuffer(index, dtype=numpy.int32) for index in index1], dtype=numpy.int64),
+                numpy.array([numpy.frombuffer(index, dtype=numpy.int32) for index in index2], dtype=numpy.int64),
+                numpy.array(widths, dtype=numpy.int64),
+                numpy.array([offsets[id(table)] for table in tables], dtype=numpy.int64),
+                numpy.concatenate([numpy.frombuffer(table, dtype=numpy.uint16) for table in distinct]).astype(numpy.int64),
+            ) + self._numpy_ways(stack)
+        return agent_ids, agent_table, box_ids, box_table, pairs
+    
+    def _numpy_ways(self, stack) -> 'tuple':
+        ways = [way for group in self.pair_groups for way in group]
+        way_pairs = numpy.zeros((len(self.box_pairs), len(ways)), dtype=numpy.int64)
+        singles = sorted(dict(single for _, way_single in ways for single in way_single).items())
+        single_columns = {box: column for column, (box, _) in enumerate(singles)}
+        way_singles = numpy.zeros((len(singles), len(ways)), dtype=numpy.int64)
+        for column, (positions, way_single) in enumerate(ways):
+            way_pairs[list(positions), column] = 1
+            for box, _ in way_single:
+                way_singles[single_columns[box], column] = 1
+        group_starts = numpy.cumsum([0] + [len(group) for group in self.pair_groups[:-1]])
+        if not singles:
+            return way_pairs, None, None, None, group_starts
+        return way_pairs, numpy.array([box for box, _ in singles]), stack([row for _, row in singles]), way_singles, group_starts
+    
+    def h_goal_count(self, state: 'State') -> 'int':
+        return state.unsatisfied_goals()
+    
+    def h_distance(self, state: 'State') -> 'int':
+        boxes = state.boxes
+        moves = sum(row[boxes[box]] for box, row in self.box_rows)
+        if self.surplus_groups:
+            moves += self.surplus_moves(boxes)
+        return self._combine(moves, state.agents)
+    
+    def h_matching(self, state: 'State') -> 'int':
+        boxes = state.boxes
+        moves = 0
+        for start, end, rows in self.box_groups:
+            moves += min_cost_assignment([[row[boxes[box]] for box in range(start, end)] for row in rows])
+        return self._combine(moves, state.agents)
+    
+    def h_pdb(self, state: 'State') -> 'int':
+        boxes = state.boxes
+        moves = sum(row[boxes[box]] for box, row in self.single_rows)
+        if self.surplus_groups:
+            moves += self.surplus_moves(boxes)
+        pair_moves = []
+        for box1, box2, index1, index2, width, table, row1, row2 in self.box_pairs:
+            cell1 = boxes[box1]
+            cell2 = boxes[box2]
+            distance = row1[cell1] + row2[cell2]
+            if index1[cell1] >= 0 and index2[cell2] >= 0:
+                distance = max(distance, table[index1[cell1] * width + index2[cell2]])
+            pair_moves.append(distance)
+        for ways in self.pair_groups:
+            moves += min(sum(pair_moves[pair] for pair in pairs) + sum(row[boxes[box]] for box, row in singles) for pairs, singles in ways)
+        return self._combine(moves, state.agents)
+    
+    def surplus_moves(self, boxes: 'array') -> 'int':
+        '''
+        Returns the box moves left in the letters with more boxes than goals: for each, the minimum cost of assigning
+        its goals to distinct boxes of the letter.
+        '''
+        return sum(min_cost_assignment([[row[boxes[box]] for box in range(start, end)] for row in rows]) for start, end, rows in self.surplus_groups)
+    
+    def _combine(self, moves: 'int', agents: 'array') -> 'int':
+        '''
+        Returns the larger of the box moves left spread over the agents, and the largest distance of an agent to its
+        goal.
+        '''
+        h = -(-moves // self.num_agents)
+        for agent, row in self.agent_rows:
+            if row[agents[agent]] > h:
+                h = row[agents[agent]]
+        return h
     
     @abstractmethod
     def f(self, state: 'State') -> 'int': pass
     
+    @abstractmethod
+    def f_many(self, states: '[State, ...]') -> '[int, ...]': pass
+    
+    @abstractmethod
+    def f_from_h(self, state: 'State', h: 'int') -> 'int': pass
+    
     @abstractmethod
     def __repr__(self): raise NotImplementedError
 
 class HeuristicAStar(Heuristic):
-    def __init__(self, initial_state: 'State'):
-        super().__init__(initial_state)
+    def __init__(self, initial_state: 'State', method: 'str' = 'distance'):
+        super().__init__(initial_state, method)
     
     def f(self, state: 'State') -> 'int':
         return state.g + self.h(state)
     
+    def f_many(self, states: '[State, ...]') -> '[int, ...]':
+        return [state.g + h for state, h in zip(states, self.h_many(states))]
+    
+    def f_from_h(self, state: 'State', h: 'int') -> 'int':
+        return state.g + h
+    
     def __repr__(self):
-        return 'A* evaluation'
+        return 'A* evaluation ({})'.format(self.method)
 
 class HeuristicWeightedAStar(Heuristic):
-    def __init__(self, initial_state: 'State', w: 'int'):
-        super().__init__(initial_state)
+    def __init__(self, initial_state: 'State', w: 'int', method: 'str' = 'distance'):
+        super().__init__(initial_state, method)
         self.w = w
     
     def f(self, state: 'State') -> 'int':
         return state.g + self.w * self.h(state)
     
+    def f_many(self, states: '[State, ...]') -> '[int, ...]':
+        return [state.g + self.w * h for state, h in zip(states, self.h_many(states))]
+    
+    def f_from_h(self, state: 'State', h: 'int') -> 'int':
+        return state.g + self.w * h
+    
     def __repr__(self):
-        return 'WA*({}) evaluation'.format(self.w)
+        return 'WA*({}) evaluation ({})'.format(self.w, self.method)
 
 class HeuristicGreedy(Heuristic):
-    def __init__(self, initial_state: 'State'):
-        super().__init__(initial_state)
+    def __init__(self, initial_state: 'State', method: 'str' = 'distance'):
+        super().__init__(initial_state, method)
     
     def f(self, state: 'State') -> 'int':
         return self.h(state)
     
+    def f_many(self, states: '[State, ...]') -> '[int, ...]':
+        return self.h_many(states)
+    
+    def f_from_h(self, state: 'State', h: 'int') -> 'int':
+        return h
+    
     def __repr__(self):
-        return 'greedy evaluation'
+        return 'greedy evaluation ({})'.format(self.method)
+
+def min_cost_assignment(cost: '[[int, ...], ...]') -> 'int':
+    '''
+    Returns the minimum total cost of assigning every row of the cost matrix to a distinct column,
+    using the Hungarian algorithm in O(rows^2 * columns). If there are more rows than columns,
+    every column is assigned to a distinct row instead.
+    '''
+    n = len(cost)
+    m = len(cost[0]) if n > 0 else 0
+    if n == 0 or m == 0:
+        return 0
+    if n > m:
+        cost = [list(column) for column in zip(*cost)]
+        n, m = m, n
+    
+    # Potentials u (rows) and v (columns), and the row assigned to each column; index 0 is a sentinel.
+    infinity = float('inf')
+    u = [0] * (n + 1)
+    v = [0] * (m + 1)
+    assigned = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for row in range(1, n + 1):
+        assigned[0] = row
+        column = 0
+        min_slack = [infinity] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[column] = True
+            current_row = assigned[column]
+            delta = infinity
+            next_column = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    slack = cost[current_row - 1][j - 1] - u[current_row] - v[j]
+                    if slack < min_slack[j]:
+                        min_slack[j] = slack
+                        way[j] = column
+                    if min_slack[j] < delta:
+                        delta = min_slack[j]
+                        next_column = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[assigned[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_slack[j] -= delta
+            column = next_column
+            if assigned[column] == 0:
+                break
+        # Augment along the alternating path.
+        while column != 0:
+            previous = way[column]
+            assigned[column] = assigned[previous]
+            column = previous
+    return -v[0]
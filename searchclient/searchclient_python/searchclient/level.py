@@ -0,0 +1,175 @@
+import random
+from array import array
+
+import cache
+from action import Action, ActionType
+from deadlocks import dead_cells
+
+class Level:
+    def __init__(self, walls, goals, agent_colors, box_colors, box_letters, num_rows, num_cols):
+        '''
+        Constructs the static part of a level, i.e. everything that does not change during search.
+        Arguments are not copied, and therefore should not be modified after being passed in.
+        
+        A single Level is built by SearchClient.parse_level and shared by reference between all states,
+        so the grids below are never copied when actions are applied.
+        
+        Cells are numbered row-major from the top-left of the level: cell = row * num_cols + col.
+        walls and goals are flat sequences indexed by cell: walls[cell] is 1 if there's a wall at cell,
+        and goals[cell] is the goal character at cell, or '' if there is no goal there.
+        
+        The agent and box colors are indexed by the agent number and box letter respectively.
+        For example, self.agent_colors[0] is the color of agent '0', and self.box_colors[0] is the color of box 'A'.
+        
+        box_letters is a string with the letter of each box, indexed by box number, with equal letters adjacent.
+        States store only the cell of each box; box_groups[i] is the (start, end) range of box numbers sharing
+        the letter of box i.
+        
+        num_rows and num_cols are the dimensions of the level, so there are num_rows * num_cols cells.
+        is_wall[cell] is 1 if there's a wall at cell, wall_occupancy[cell] is ord('+') at walls and 0 elsewhere
+        (the occupancy grid of a state without agents and boxes, see State.occupancy), and goal_cells lists (cell, goal character) for every goal.
+        box_goal_at[cell] is the letter of the box goal at cell, or '' if there is none, and agent_goal_cells[agent]
+        is the cell of the goal of agent, or None if it has no goal.
+        
+        dead_cells is indexed by box letter like box_colors. dead_cells[0] maps every cell to 1 if a box 'A' can never
+        reach a goal 'A' from there (see deadlocks.py), or is None if boxes 'A' do not need goals: only letters with
+        at least as many goals as boxes are checked.
+        
+        agent_deltas[action.index] and box_deltas[action.index] are the agent and box deltas of action as cell offsets,
+        e.g. -num_cols for north, so that actions move between cells with a single addition.
+        
+        moves[cell], pushes[cell] and pulls[cell] list the actions of each type that an agent at cell can perform
+        without running into the static walls, with the cells they involve precomputed:
+            moves[cell]:  (action, agent destination)
+            pushes[cell]: (action, box cell, box destination)
+            pulls[cell]:  (action, agent destination, box cell)
+        Only whether the cells are occupied by agents or boxes remains to be checked during search.
+        action_masks[cell] has bit action.index set for every such action, and the lists of a cell are built from it
+        the first time the cell is looked up, so that only cells the agents reach are ever listed.
+        
+        States are hashed with Zobrist keys: agent_keys[agent][cell] and box_keys[box][cell] are random bitstrings,
+        and the hash of a state is the XOR of the keys of every occupied (agent, cell) and (box, cell) pair.
+        Boxes of the same letter share their keys, so the hash does not depend on how equal boxes are numbered.
+        '''
+        self.goals = goals
+        self.agent_colors = agent_colors
+        self.box_colors = box_colors
+        self.box_letters = box_letters
+        self.box_groups = [(box_letters.index(letter), box_letters.rindex(letter) + 1) for letter in box_letters]
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        
+        num_cells = num_rows * num_cols
+        self.num_cells = num_cells
+        self.is_wall = bytes(1 if wall else 0 for wall in walls)
+        self.wall_occupancy = bytes(ord('+') if is_wall else 0 for is_wall in self.is_wall)
+        self.box_codes = box_letters.encode('ascii')
+        self.goal_cells = [(cell, goal) for cell, goal in enumerate(goals) if goal != '']
+        self.box_goal_at = ['' for _ in range(num_cells)]
+        self.agent_goal_cells = [None for _ in agent_colors]
+        for cell, goal in self.goal_cells:
+            if 'A' <= goal <= 'Z':
+                self.box_goal_at[cell] = goal
+            else:
+                self.agent_goal_cells[ord(goal) - ord('0')] = cell
+        
+        self.dead_cells = [None for _ in box_colors]
+        for start, end in sorted(set(self.box_groups)):
+            goal_cells = [cell for cell, goal in self.goal_cells if goal == box_letters[start]]
+            if len(goal_cells) >= end - start:
+                letter = box_letters[start]
+                self.dead_cells[ord(letter) - ord('A')] = cache.cached_array(self, 'dead-' + letter, 'B', num_cells, lambda: array('B', dead_cells(self, goal_cells)))
+        
+        self.agent_deltas = [action.agent_row_delta * num_cols + action.agent_col_delta for action in Action]
+        self.box_deltas = [action.box_row_delta * num_cols + action.box_col_delta for action in Action]
+        
+        self.action_masks = cache.cached_array(self, 'action-masks', 'I', num_cells, self._action_masks)
+        self.moves = _ActionTable(self, ActionType.Move)
+        self.pushes = _ActionTable(self, ActionType.Push)
+        self.pulls = _ActionTable(self, ActionType.Pull)
+        
+        rng = random.Random(0)
+        self.agent_keys = [[rng.getrandbits(64) for _ in range(num_cells)] if color is not None else None for color in agent_colors]
+        letter_keys = {letter: [rng.getrandbits(64) for _ in range(num_cells)] for letter in sorted(set(box_letters))}
+        self.box_keys = [letter_keys[letter] for letter in box_letters]
+    
+    def _action_masks(self) -> 'array':
+        masks = array('I', bytes(array('I').itemsize * self.num_cells))
+        for cell in range(self.num_cells):
+            if self.is_wall[cell]:
+                continue
+            mask = 0
+            for action in Action:
+                if action.type is ActionType.NoOp:
+                    continue
+                agent_destination = self.offset(cell, action.agent_row_delta, action.agent_col_delta)
+                if agent_destination is None:
+                    continue
+                if action.type is ActionType.Push:
+                    box_cell = self.offset(agent_destination, action.box_row_delta, action.box_col_delta)
+                elif action.type is ActionType.Pull:
+                    box_cell = self.offset(cell, action.box_row_delta, action.box_col_delta)
+                else:
+                    box_cell = agent_destination
+                if box_cell is not None:
+                    mask |= 1 << action.index
+            masks[cell] = mask
+        return masks
+    
+    def offset(self, cell: 'int', row_delta: 'int', col_delta: 'int') -> 'int':
+        '''
+        Returns the cell row_delta rows and col_delta columns away from cell, or None if that is a wall or outside the level.
+        '''
+        row, col = divmod(cell, self.num_cols)
+        row += row_delta
+        col += col_delta
+        if not (0 <= row < self.num_rows and 0 <= col < self.num_cols) or self.is_wall[row * self.num_cols + col]:
+            return None
+        return row * self.num_cols + col
+    
+    def neighbours(self, cell: 'int') -> '[int, ...]':
+        '''
+        Returns the cells north, south, east and west of cell that are inside the level and not walls.
+        '''
+        row, col = divmod(cell, self.num_cols)
+        result = []
+        if row > 0 and not self.is_wall[cell - self.num_cols]: result.append(cell - self.num_cols)
+        if row < self.num_rows - 1 and not self.is_wall[cell + self.num_cols]: result.append(cell + self.num_cols)
+        if col < self.num_cols - 1 and not self.is_wall[cell + 1]: result.append(cell + 1)
+        if col > 0 and not self.is_wall[cell - 1]: result.append(cell - 1)
+        return result
+    
+    def zobrist_hash(self, agents: 'array', boxes: 'array') -> 'int':
+        _hash = 0
+        for agent, cell in enumerate(agents):
+            _hash ^= self.agent_keys[agent][cell]
+        for box, cell in enumerate(boxes):
+            _hash ^= self.box_keys[box][cell]
+        return _hash
+
+class _ActionTable(dict):
+    '''
+    The lists of one of Level.moves, Level.pushes and Level.pulls, by cell, filled in from Level.action_masks on the
+    first lookup of each cell.
+    '''
+    def __init__(self, level: 'Level', action_type: 'ActionType'):
+        super().__init__()
+        self.level = level
+        self.action_type = action_type
+    
+    def __missing__(self, cell: 'int') -> 'list':
+        level = self.level
+        mask = level.action_masks[cell]
+        actions = []
+        for action in Action:
+            if action.type is not self.action_type or not mask >> action.index & 1:
+                continue
+            agent_destination = cell + level.agent_deltas[action.index]
+            if action.type is ActionType.Move:
+                actions.append((action, agent_destination))
+            elif action.type is ActionType.Push:
+                actions.append((action, agent_destination, agent_destination + level.box_deltas[action.index]))
+            else:
+                actions.append((action, agent_destination, cell + level.box_deltas[action.index]))
+        self[cell] = actions
+        return actions
@@ -0,0 +1,125 @@
+import json
+import sys
+import threading
+import time
+
+import memory
+
+class Monitor:
+    '''
+    Tracks the progress and memory usage of a search, and reports it on stderr.
+    
+    Measuring memory usage is a system call, so it is only sampled periodically rather than on every expansion.
+    The mode selects when samples are taken:
+        'iterations': every interval expansions (default 1000).
+        'time':       on the first expansion after interval seconds have passed (default 0.5).
+        'thread':     every interval seconds on a background thread (default 0.5), so expansions only read the
+                      last sample.
+    Every sample is reported as a status record, in the original text form or as one JSON object per line:
+        {"event": ..., "time": ..., "explored": ..., "frontier": ..., "generated": ..., "explored_per_s": ...,
+         "generated_per_s": ..., "memory_mb": ..., "max_memory_mb": ...}
+    Rates are measured since the previous record.
+    
+    The search calls start(frontier) once, tick(explored, generated) once per expansion, which returns True when
+    the last sample exceeds memory.max_usage, and report(event) whenever it wants a record, e.g. when it ends.
+    '''
+    MODES = ('iterations', 'time', 'thread')
+    FORMATS = ('text', 'json')
+    # Events that end a search; their records hold the final counts, and no record follows them.
+    FINAL_EVENTS = ('solved', 'exhausted', 'memory')
+    
+    def __init__(self, mode: 'str' = 'iterations', interval: 'float' = None, format: 'str' = 'text'):
+        if mode not in Monitor.MODES:
+            raise ValueError('Unknown monitor mode: {}.'.format(mode))
+        if format not in Monitor.FORMATS:
+            raise ValueError('Unknown status format: {}.'.format(format))
+        self.mode = mode
+        self.interval = interval if interval is not None else (1000 if mode == 'iterations' else 0.5)
+        self.format = format
+        
+        self.frontier = None
+        self.explored = 0
+        self.generated = 0
+        self.usage = 0.0
+        self._countdown = 0
+        self._next_sample = 0.0
+        self._start_time = 0.0
+        self._last = (0.0, 0, 0)
+        # Reentrant, so that the sampling thread can hold it across its check of _stopped and its report.
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._thread = None
+    
+    def start(self, frontier: 'Frontier'):
+        self.frontier = frontier
+        self._start_time = time.perf_counter()
+        self._last = (self._start_time, 0, 0)
+        self.usage = memory.get_usage()
+        if self.mode == 'iterations':
+            self._countdown = int(self.interval)
+        elif self.mode == 'time':
+            self._next_sample = self._start_time + self.interval
+        else:
+            self._thread = threading.Thread(target=self._run, name='monitor', daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    
+    def tick(self, explored: 'int', generated: 'int') -> 'bool':
+        self.explored = explored
+        self.generated = generated
+        if self.mode == 'iterations':
+            self._countdown -= 1
+            if self._countdown <= 0:
+                self._countdown = int(self.interval)
+                self.report()
+        elif self.mode == 'time':
+            if time.perf_counter() >= self._next_sample:
+                self.report()
+                self._next_sample = time.perf_counter() + self.interval
+        return self.usage > memory.max_usage
+    
+    def report(self, event: 'str' = 'status'):
+        '''
+        Samples memory usage and writes a record of event. Final events (see FINAL_EVENTS) stop the sampling
+        thread first, so that no status record follows them.
+        '''
+        if event in Monitor.FINAL_EVENTS:
+            self.stop()
+        with self._lock:
+            self.usage = memory.get_usage()
+            now = time.perf_counter()
+            last_time, last_explored, last_generated = self._last
+            elapsed = now - last_time
+            explored, generated = self.explored, self.generated
+            self._last = (now, explored, generated)
+            frontier_size = self.frontier.size() if self.frontier is not None else 0
+            
+            if self.format == 'json':
+                record = {
+                    'event': event,
+                    'time': round(now - self._start_time, 3),
+                    'explored': explored,
+                    'frontier': frontier_size,
+                    'generated': generated,
+                    'explored_per_s': round((explored - last_explored) / elapsed, 1) if elapsed > 0 else 0.0,
+                    'generated_per_s': round((generated - last_generated) / elapsed, 1) if elapsed > 0 else 0.0,
+                    'memory_mb': round(self.usage, 2),
+                    'max_memory_mb': memory.max_usage,
+                }
+                print(json.dumps(record), file=sys.stderr, flush=True)
+            else:
+                status_template = '#Explored: {:8,}, #Frontier: {:8,}, #Generated: {:8,}, Time: {:3.3f} s\n[Alloc: {:4.2f} MB, MaxAlloc: {:4.2f} MB]'
+                print(status_template.format(explored, frontier_size, generated, now - self._start_time, self.usage, memory.max_usage), file=sys.stderr, flush=True)
+    
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            # Checked again under the lock, since stop may have been called while waiting for it.
+            with self._lock:
+                if self._stopped.is_set():
+                    return
+                self.report()
@@ -0,0 +1,268 @@
+from array import array
+
+from action import Action, ActionType
+from level import Level
+from state import State
+
+class ODNode:
+    '''
+    A node of operator decomposition search (Standley 2010): instead of expanding a state into the product of
+    the actions of all agents, agents are assigned an action one at a time, so a state with n agents is expanded
+    through n - 1 layers of intermediate nodes and each expansion generates at most one agent's actions.
+    
+    state is base with the actions of agents 0 .. agent - 1 applied, and the remaining agents doing NoOp.
+    agent is the next agent to be assigned; a node with agent 0 is a standard node, for which base is state.
+    Actions are checked for applicability in base and for conflicts with the actions already assigned, so the
+    joint actions reached through the intermediate nodes are exactly those of State.successors.
+    
+    ODNode implements the parts of the State interface used by SearchClient.search, the frontiers and the
+    heuristics, so they run on these nodes unchanged; search from ODNode.root(initial_state).
+    '''
+    __slots__ = ('state', 'base', 'agent')
+    
+    def __init__(self, state: 'State', base: 'State', agent: 'int'):
+        self.state = state
+        self.base = base
+        self.agent = agent
+    
+    @staticmethod
+    def root(state: 'State') -> 'ODNode':
+        return ODNode(state, state, 0)
+    
+    @property
+    def g(self) -> 'int':
+        return self.state.g
+    
+    @property
+    def agents(self) -> 'array':
+        return self.state.agents
+    
+    @property
+    def boxes(self) -> 'array':
+        return self.state.boxes
+    
+    def unsatisfied_goals(self) -> 'int':
+        return self.state.unsatisfied_goals()
+    
+    def is_goal_state(self) -> 'bool':
+        return self.agent == 0 and self.state.is_goal_state()
+    
+    def child_g(self) -> 'int':
+        # The nodes below base all assign parts of the same joint action, so they share the g of its result.
+        return self.base.g + 1
+    
+    def key(self) -> 'bytes':
+        if self.agent == 0:
+            return self.state.key()
+        return self.base.key() + self.state.key() + bytes((self.agent,))
+    
+    def restore(self, key: 'bytes', g: 'int', joint_action: '[Action, ...]', unsatisfied: 'int' = None) -> 'ODNode':
+        '''
+        Returns the node with the given key, g, joint action (the actions assigned so far) and number of unsatisfied
+        goals of its state for NodeStore.state. The key of an intermediate node is its base's key, its state's key
+        and the agent, so it is longer than the key of a standard node.
+        '''
+        level = self.state.level
+        size = len(self.base.key())
+        if len(key) == size:
+            return ODNode.root(self.state.restore(key, g, unsatisfied))
+        base = State.from_key(level, key[:size])
+        base.g = g - 1
+        state = State.from_key(level, key[size:2 * size])
+        state.g = g
+        state._unsatisfied = unsatisfied
+        state.joint_action = list(joint_action)
+        return ODNode(state, base, key[-1])
+    
+    def successors(self, shuffle: 'bool' = False) -> '[([Action, ...], bytes), ...]':
+        '''
+        Lazily generates (joint_action, key) for every child of this node, like State.successors. joint_action
+        holds the actions assigned so far, padded with NoOp, and is passed back to apply_action.
+        '''
+        base = self.base
+        agent = self.agent
+        num_agents = len(base.agents)
+        last = agent + 1 == num_agents
+        
+        actions = base.get_applicable_actions(agent)
+        if shuffle:
+            State._RNG.shuffle(actions)
+        assigned = self.state.joint_action if agent > 0 else [Action.NoOp for _ in range(num_agents)]
+        prefix = base.key() if not last else None
+        suffix = bytes((agent + 1,))
+        
+        try:
+            for action in actions:
+                joint_action = assigned[:]
+                joint_action[agent] = action
+                if agent > 0 and action is not Action.NoOp and base.is_conflicting(joint_action):
+                    continue
+                key = base.child_key(joint_action)
+                yield joint_action, key if last else prefix + key + suffix
+        finally:
+            base.discard_occupancy()
+    
+    def apply_action(self, joint_action: '[Action, ...]') -> 'ODNode':
+        state = self.base.apply_action(joint_action)
+        if self.agent + 1 == len(state.agents):
+            return ODNode(state, state, 0)
+        return ODNode(state, self.base, self.agent + 1)
+    
+    def extract_plan(self) -> '[Action, ...]':
+        return self.state.extract_plan()
+    
+    def __hash__(self):
+        if self.agent == 0:
+            return self.state.__hash__()
+        return hash((self.base.__hash__(), self.state.__hash__(), self.agent))
+    
+    def __eq__(self, other):
+        if not isinstance(other, ODNode) or self.agent != other.agent:
+            return False
+        return self.state == other.state and (self.agent == 0 or self.base == other.base)
+    
+    def __repr__(self):
+        return repr(self.state)
+
+def independence_detection(initial_state: 'State', solve) -> '[[Action, ...], ...]':
+    '''
+    Plans independent groups of agents separately and merges their plans (simple independence detection,
+    Standley 2010). solve(state) returns a plan for a state, or None if there is none.
+    
+    Agents of the same color can move the same boxes, so they start out in one group. Each group is solved in a
+    sub-level holding only its own agents, boxes and goals, plus the boxes no agent can move. The plans are then
+    executed together, padded with NoOp; when an action of one group is blocked by or conflicts with another
+    group, the two groups are merged and planned jointly. This repeats until the plans run without conflicts,
+    at worst with all agents in one group, which is the original level.
+    
+    Removing other groups only removes obstacles, so if a group has no plan on its own, the level has none.
+    '''
+    level = initial_state.level
+    num_agents = len(initial_state.agents)
+    
+    groups = []
+    for agent in range(num_agents):
+        for group in groups:
+            if level.agent_colors[group[0]] is level.agent_colors[agent]:
+                group.append(agent)
+                break
+        else:
+            groups.append([agent])
+    
+    plans = []
+    for group in groups:
+        plan = _solve_group(initial_state, group, solve)
+        if plan is None:
+            return None
+        plans.append(plan)
+    
+    while True:
+        conflict = _find_conflict(initial_state, groups, plans)
+        if conflict is None:
+            return _merge_plans(num_agents, groups, plans)
+        if len(conflict) < 2:
+            # The other party could not be identified; fall back to planning all agents jointly.
+            conflict = set(range(len(groups)))
+        
+        merged = sorted(agent for index in conflict for agent in groups[index])
+        groups = [group for index, group in enumerate(groups) if index not in conflict]
+        plans = [plan for index, plan in enumerate(plans) if index not in conflict]
+        plan = _solve_group(initial_state, merged, solve)
+        if plan is None:
+            return None
+        groups.append(merged)
+        plans.append(plan)
+
+def sub_state(state: 'State', agents: '[int, ...]') -> 'State':
+    '''
+    Returns state restricted to the given agents, renumbered 0, 1, ... in the given order, with the boxes and goals
+    of their colors. Boxes that no agent of the level can move are kept as obstacles, but their goals are dropped.
+    '''
+    level = state.level
+    colors = {level.agent_colors[agent] for agent in agents}
+    movable = {color for color in level.agent_colors if color is not None}
+    
+    def kept_letter(letter: 'char') -> 'bool':
+        color = level.box_colors[ord(letter) - ord('A')]
+        return color in colors or color not in movable
+    
+    boxes = [box for box, letter in enumerate(level.box_letters) if kept_letter(letter)]
+    goals = ['' for _ in level.goals]
+    for cell, goal in level.goal_cells:
+        if 'A' <= goal <= 'Z':
+            if level.box_colors[ord(goal) - ord('A')] in colors:
+                goals[cell] = goal
+        elif ord(goal) - ord('0') in agents:
+            goals[cell] = chr(ord('0') + agents.index(ord(goal) - ord('0')))
+    agent_colors = [None for _ in level.agent_colors]
+    for number, agent in enumerate(agents):
+        agent_colors[number] = level.agent_colors[agent]
+    box_letters = ''.join(level.box_letters[box] for box in boxes)
+    
+    sub_level = Level(level.is_wall, goals, agent_colors, level.box_colors, box_letters, level.num_rows, level.num_cols)
+    return State(sub_level, array('h', (state.agents[agent] for agent in agents)), array('h', (state.boxes[box] for box in boxes)))
+
+def _solve_group(initial_state: 'State', group: '[int, ...]', solve) -> '[[Action, ...], ...]':
+    if len(group) == len(initial_state.agents):
+        return solve(initial_state)
+    return solve(sub_state(initial_state, group))
+
+def _merge_plans(num_agents: 'int', groups: '[[int, ...], ...]', plans: '[[[Action, ...], ...], ...]') -> '[[Action, ...], ...]':
+    length = max(len(plan) for plan in plans)
+    merged = [[Action.NoOp for _ in range(num_agents)] for _ in range(length)]
+    for group, plan in zip(groups, plans):
+        for step, joint_action in enumerate(plan):
+            for number, agent in enumerate(group):
+                merged[step][agent] = joint_action[number]
+    return merged
+
+def _find_conflict(initial_state: 'State', groups: '[[int, ...], ...]', plans: '[[[Action, ...], ...], ...]') -> '{int, ...}':
+    '''
+    Executes the merged plans from initial_state and returns the indices of the groups involved in the first
+    inapplicable or conflicting joint action, or None if the merged plan is valid.
+    '''
+    level = initial_state.level
+    num_agents = len(initial_state.agents)
+    group_of = [None for _ in range(num_agents)]
+    for index, group in enumerate(groups):
+        for agent in group:
+            group_of[agent] = index
+    
+    state = initial_state
+    for joint_action in _merge_plans(num_agents, groups, plans):
+        for agent, action in enumerate(joint_action):
+            if not state.is_applicable(agent, action):
+                blocker = _blocker(state, agent, action)
+                if blocker is None:
+                    return set(range(len(groups)))
+                if '0' <= blocker <= '9':
+                    return {group_of[agent], group_of[ord(blocker) - ord('0')]}
+                color = level.box_colors[ord(blocker) - ord('A')]
+                return {group_of[agent]} | {group_of[other] for other in range(num_agents) if level.agent_colors[other] is color}
+        
+        if state.is_conflicting(joint_action):
+            for a1 in range(num_agents):
+                for a2 in range(a1 + 1, num_agents):
+                    if group_of[a1] == group_of[a2]:
+                        continue
+                    pair = [Action.NoOp for _ in range(num_agents)]
+                    pair[a1] = joint_action[a1]
+                    pair[a2] = joint_action[a2]
+                    if state.is_conflicting(pair):
+                        return {group_of[a1], group_of[a2]}
+            return set(range(len(groups)))
+        
+        state = state.apply_action(joint_action)
+    return None
+
+def _blocker(state: 'State', agent: 'int', action: 'Action') -> 'char':
+    '''
+    Returns the agent number or box letter occupying the cell that action of agent moves into, or None.
+    '''
+    level = state.level
+    cell = level.offset(state.agents[agent], action.agent_row_delta, action.agent_col_delta)
+    if cell is not None and action.type is ActionType.Push:
+        cell = level.offset(cell, action.box_row_delta, action.box_col_delta)
+    if cell is None:
+        return None
+    return state.agent_at(cell) or state.box_at(cell) or None
@@ -0,0 +1,170 @@
+from array import array
+
+from multiagent import ODNode
+
+class NodeStore:
+    '''
+    Interns the nodes of a search by key, so that the search and its frontier refer to nodes by integer id instead
+    of keeping State objects alive.
+    
+    Each node is stored once as its packed key (see State.key), with its parent id, joint action, g and number of
+    unsatisfied goals in parallel arrays indexed by id; joint actions are interned too, and stored as ids. This
+    takes a key, a dict entry and a few array slots per node, where a State takes two arrays, a slotted object, and
+    the chain of its ancestors.
+    
+    Nodes are turned back into states with state(node), through restore on the initial state (State.restore, or
+    ODNode.restore, which also takes the joint action of the node), and plans are read off the parent ids with
+    extract_plan(node). The states restored carry their number of unsatisfied goals, so that neither the goal test
+    nor apply_action recounts the goals of every state popped.
+    
+    Nodes the search forgets (see discard) are freed once no other node's path leads through them, and their ids
+    are reused, so that a search that keeps dropping and regenerating nodes does not grow the store.
+    '''
+    NONE = -1
+    
+    def __init__(self, initial_state: 'State'):
+        self.initial_state = initial_state
+        self.operator_decomposition = isinstance(initial_state, ODNode)
+        self.index = {}
+        self.keys = []
+        self.parents = array('i')
+        self.actions = array('i')
+        self.g = array('i')
+        self.unsatisfied = array('i')
+        self.children = array('i')
+        self.free = []
+        self.joint_actions = []
+        self.joint_action_ids = {}
+    
+    def __len__(self) -> 'int':
+        return len(self.index)
+    
+    def find(self, key: 'bytes') -> 'int':
+        '''
+        Returns the id of the node with key, or None if there is none.
+        '''
+        return self.index.get(key)
+    
+    def add(self, key: 'bytes', parent: 'int', joint_action: '[Action, ...]', g: 'int', unsatisfied: 'int' = None) -> 'int':
+        '''
+        Adds a node reached from node parent by joint_action, and returns its id. The root has parent NONE and
+        joint_action None. unsatisfied is the number of unsatisfied goals of the node (see State.unsatisfied_goals),
+        or None if it is not known, in which case the state of the node counts them when needed.
+        '''
+        action = self._joint_action_id(joint_action)
+        if unsatisfied is None:
+            unsatisfied = NodeStore.NONE
+        if self.free:
+            node = self.free.pop()
+            self.keys[node] = key
+            self.parents[node] = parent
+            self.actions[node] = action
+            self.g[node] = g
+            self.unsatisfied[node] = unsatisfied
+            self.children[node] = 0
+        else:
+            node = len(self.keys)
+            self.keys.append(key)
+            self.parents.append(parent)
+            self.actions.append(action)
+            self.g.append(g)
+            self.unsatisfied.append(unsatisfied)
+            self.children.append(0)
+        self.index[key] = node
+        if parent != NodeStore.NONE:
+            self.children[parent] += 1
+        return node
+    
+    def update(self, node: 'int', parent: 'int', joint_action: '[Action, ...]', g: 'int'):
+        '''
+        Records a cheaper path to node, reached from node parent by joint_action. The old parent is freed if it was
+        forgotten and only kept for the path of node.
+        '''
+        old_parent = self.parents[node]
+        if parent != NodeStore.NONE:
+            self.children[parent] += 1
+        self.parents[node] = parent
+        self.actions[node] = self._joint_action_id(joint_action)
+        self.g[node] = g
+        if old_parent != NodeStore.NONE:
+            self.children[old_parent] -= 1
+            self._free(old_parent)
+    
+    def is_reached(self, node: 'int') -> 'bool':
+        '''
+        Returns False if node has been forgotten.
+        '''
+        key = self.keys[node]
+        return key is not None and self.index.get(key) == node
+    
+    def discard(self, node: 'int'):
+        '''
+        Forgets node, so that it is added as a new node if it is reached again. The record of node is kept as long
+        as the paths of its children still lead through it; nodes already forgotten are left alone.
+        '''
+        if not self.is_reached(node):
+            return
+        del self.index[self.keys[node]]
+        self._free(node)
+    
+    def _free(self, node: 'int'):
+        # Free node if it is forgotten and has no children, and then every forgotten ancestor left without children.
+        while node != NodeStore.NONE and self.children[node] == 0 and not self.is_reached(node):
+            parent = self.parents[node]
+            self.keys[node] = None
+            self.free.append(node)
+            if parent != NodeStore.NONE:
+                self.children[parent] -= 1
+            node = parent
+    
+    def state(self, node: 'int') -> 'State':
+        '''
+        Returns node as a state (or ODNode, like the initial state), with g, joint action and the number of
+        unsatisfied goals set but no parent.
+        '''
+        unsatisfied = self.unsatisfied[node]
+        unsatisfied = unsatisfied if unsatisfied != NodeStore.NONE else None
+        if self.operator_decomposition:
+            action = self.actions[node]
+            return self.initial_state.restore(self.keys[node], self.g[node], self.joint_actions[action] if action != NodeStore.NONE else None, unsatisfied)
+        return self.initial_state.restore(self.keys[node], self.g[node], unsatisfied)
+    
+    def extract_plan(self, node: 'int') -> '[[Action, ...], ...]':
+        '''
+        Returns the joint actions on the path from the root to node.
+        
+        A plan has one joint action per unit of g, so when several nodes on the path share a g, like the
+        intermediate nodes of operator decomposition, only the joint action of the last of them is a step.
+        '''
+        plan = [None for _ in range(self.g[node])]
+        while self.parents[node] != NodeStore.NONE:
+            g = self.g[node]
+            if plan[g - 1] is None:
+                plan[g - 1] = list(self.joint_actions[self.actions[node]])
+            node = self.parents[node]
+        return plan
+    
+    def extract_path(self, node: 'int') -> '[[Action, ...], ...]':
+        '''
+        Returns the joint actions of every node on the path from the root to node, one step per node.
+        
+        Unlike extract_plan, this does not rely on g, so it stays right when cheaper paths to ancestors of node were
+        found after node was reached, without updating node itself (see SearchClient.anytime_search). It does not
+        apply to operator decomposition, where nodes are not all steps.
+        '''
+        plan = []
+        while self.parents[node] != NodeStore.NONE:
+            plan.append(list(self.joint_actions[self.actions[node]]))
+            node = self.parents[node]
+        plan.reverse()
+        return plan
+    
+    def _joint_action_id(self, joint_action: '[Action, ...]') -> 'int':
+        if joint_action is None:
+            return NodeStore.NONE
+        joint_action = tuple(joint_action)
+        action = self.joint_action_ids.get(joint_action)
+        if action is None:
+            action = self.joint_action_ids[joint_action] = len(self.joint_actions)
+            self.joint_actions.append(joint_action)
+        return action
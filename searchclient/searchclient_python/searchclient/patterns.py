@@ -0,0 +1,166 @@
+import weakref
+from array import array
+
+import cache
+from distances import UNREACHABLE
+
+# Pair tables with more entries than this are not built; the boxes of such pairs are estimated by distances alone.
+MAX_PAIR_ENTRIES = 1 << 20
+# Letters with more boxes than this are not paired, since the ways to pair them up (see pairings) grow too fast:
+# 15 for 5 or 6 boxes, 105 for 7.
+MAX_GROUP_BOXES = 6
+
+# The pattern databases of every level they were built for, so that heuristics over the same level share them.
+_databases = weakref.WeakKeyDictionary()
+
+class PairDatabase:
+    def __init__(self, level: 'Level', first: 'str', second: 'str'):
+        '''
+        Pattern database over a pair of boxes with the letters first and second (which may be equal): the least number
+        of box moves that puts both boxes on distinct goals of their letters, from every placement of the pair.
+        
+        The pair is solved in isolation, over the static walls: other boxes are left out, and the agent is assumed to
+        be wherever it needs to be, like in deadlocks.dead_cells. A box can move from cell c to a neighbouring cell d
+        if d is free and an agent can push it from another free neighbour of c, or pull it by stepping from d onto
+        another free neighbour of d; here, the other box of the pair is not free. The table is filled by a BFS
+        backwards from every placement of the pair on goals, so each entry is exact for this relaxation, and a
+        placement from which the pair can not be solved holds UNREACHABLE.
+        
+        Only cells that are not dead for the letter (see Level.dead_cells) are indexed: index1[cell] and index2[cell]
+        are the positions of cell among the live cells of first and second, or -1, and the entry of the pair at cells
+        (c1, c2) is table[index1[c1] * width + index2[c2]], width being the number of live cells of second.
+        '''
+        self.first = first
+        self.second = second
+        self.cells1, self.index1 = PairDatabase._live_cells(level, first)
+        self.cells2, self.index2 = PairDatabase._live_cells(level, second)
+        self.width = len(self.cells2)
+        size = len(self.cells1) * self.width
+        self.table = cache.cached_array(level, 'pairs-{}{}'.format(first, second), 'H', size, lambda: self._build(level))
+    
+    @staticmethod
+    def _live_cells(level: 'Level', letter: 'str') -> '([int, ...], array)':
+        dead = level.dead_cells[ord(letter) - ord('A')]
+        cells = [cell for cell in range(level.num_cells) if not level.is_wall[cell] and not dead[cell]]
+        index = array('i', [-1]) * level.num_cells
+        for position, cell in enumerate(cells):
+            index[cell] = position
+        return cells, index
+    
+    @staticmethod
+    def _sources(level: 'Level', cells: '[int, ...]', index: 'array') -> '[[(int, int, int), ...], ...]':
+        '''
+        Returns, for every live cell d, the moves of a box into d from a live neighbour c, as (position of c, c,
+        helper): helper is the only free cell the agent can push or pull from, or -1 if there are several (or None
+        if there is none, in which case the move is left out).
+        '''
+        sources = []
+        for destination in cells:
+            moves = []
+            for cell in level.neighbours(destination):
+                if index[cell] < 0:
+                    continue
+                helpers = set(level.neighbours(cell)) | set(level.neighbours(destination))
+                helpers -= {cell, destination}
+                if helpers:
+                    moves.append((index[cell], cell, helpers.pop() if len(helpers) == 1 else -1))
+            sources.append(moves)
+        return sources
+    
+    def _build(self, level: 'Level') -> 'array':
+        cells1, cells2, width = self.cells1, self.cells2, self.width
+        sources1 = PairDatabase._sources(level, cells1, self.index1)
+        sources2 = PairDatabase._sources(level, cells2, self.index2)
+        table = array('H', [UNREACHABLE]) * (len(cells1) * width)
+        
+        layer = []
+        for cell1, goal1 in level.goal_cells:
+            if goal1 != self.first:
+                continue
+            for cell2, goal2 in level.goal_cells:
+                if goal2 == self.second and cell2 != cell1:
+                    entry = self.index1[cell1] * width + self.index2[cell2]
+                    table[entry] = 0
+                    layer.append(entry)
+        
+        # Backwards, the box moves of the next layer are the moves into the cells of the boxes in this layer.
+        distance = 0
+        while layer:
+            distance += 1
+            next_layer = []
+            for entry in layer:
+                index1, index2 = divmod(entry, width)
+                cell1 = cells1[index1]
+                cell2 = cells2[index2]
+                for source, cell, helper in sources1[index1]:
+                    if cell != cell2 and helper != cell2:
+                        previous = source * width + index2
+                        if table[previous] == UNREACHABLE:
+                            table[previous] = distance
+                            next_layer.append(previous)
+                for source, cell, helper in sources2[index2]:
+                    if cell != cell1 and helper != cell1:
+                        previous = index1 * width + source
+                        if table[previous] == UNREACHABLE:
+                            table[previous] = distance
+                            next_layer.append(previous)
+            layer = next_layer
+        return table
+
+def pair_database(level: 'Level', first: 'str', second: 'str') -> 'PairDatabase':
+    '''
+    Returns the PairDatabase of level for boxes with the letters first and second, building it on first use, or None
+    if it can not be built: a letter has fewer goals than boxes (so has no dead cells, see Level.dead_cells), or the
+    table would exceed MAX_PAIR_ENTRIES.
+    '''
+    databases = _databases.setdefault(level, {})
+    if (first, second) not in databases:
+        database = None
+        dead1 = level.dead_cells[ord(first) - ord('A')]
+        dead2 = level.dead_cells[ord(second) - ord('A')]
+        if dead1 is not None and dead2 is not None:
+            live = [sum(1 for cell in range(level.num_cells) if not level.is_wall[cell] and not dead[cell]) for dead in (dead1, dead2)]
+            if live[0] * live[1] <= MAX_PAIR_ENTRIES:
+                database = PairDatabase(level, first, second)
+        databases[(first, second)] = database
+    return databases[(first, second)]
+
+def box_groups(level: 'Level') -> '([((int, ...), PairDatabase), ...], [int, ...])':
+    '''
+    Splits the boxes of level into the groups of boxes of a letter that can be paired, returned as (boxes, database),
+    and the single boxes. A letter is paired if it has 2 to MAX_GROUP_BOXES boxes and a database; the boxes of other
+    letters are left single.
+    
+    Boxes are only paired with boxes of their own letter, and a group is estimated by its best pairing (see
+    pairings), because the boxes of a letter are renumbered by cell as they move (see State.apply_action): pairs
+    fixed by box number would pair up different boxes from one state to the next, and their sum could drop by more
+    than one per box move.
+    '''
+    groups = []
+    singles = []
+    for start, end in sorted(set(level.box_groups)):
+        letter = level.box_letters[start]
+        database = None
+        if 2 <= end - start <= MAX_GROUP_BOXES and level.dead_cells[ord(letter) - ord('A')] is not None:
+            database = pair_database(level, letter, letter)
+        if database is not None:
+            groups.append((tuple(range(start, end)), database))
+        else:
+            singles.extend(range(start, end))
+    return groups, singles
+
+def pairings(boxes: '(int, ...)') -> '[([(int, int), ...], [int, ...]), ...]':
+    '''
+    Returns every way to split boxes into pairs, and one single box if there is an odd number of them, as (pairs,
+    singles).
+    '''
+    if len(boxes) < 2:
+        return [([], list(boxes))]
+    first, rest = boxes[0], boxes[1:]
+    result = []
+    if len(boxes) % 2 == 1:
+        result.extend((pairs, [first]) for pairs, _ in pairings(rest))
+    for position, other in enumerate(rest):
+        for pairs, singles in pairings(rest[:position] + rest[position + 1:]):
+            result.append(([(first, other)] + pairs, singles))
+    return result
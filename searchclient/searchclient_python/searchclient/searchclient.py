@@ -1,32 +1,51 @@
 import argparse
 import io
+import multiprocessing
+import os
+import queue
 import sys
+import threading
 import time
+from array import array
 
+import psutil
+
+import cache
+import heuristic
 import memory
 from color import Color
+from level import Level
 from state import State
-from frontier import FrontierBFS, FrontierDFS, FrontierBestFirst
-from heuristic import HeuristicAStar, HeuristicWeightedAStar, HeuristicGreedy
+from frontier import FrontierBFS, FrontierDFS, FrontierBestFirst, FrontierMemoryBounded
+from heuristic import HAVE_NUMPY, Heuristic, HeuristicAStar, HeuristicWeightedAStar, HeuristicGreedy
+from multiagent import ODNode, independence_detection
+from monitor import Monitor
+from nodestore import NodeStore
+from hdastar import hda_star_search
+from bidirectional import goal_states, bidirectional_search
 
 class SearchClient:
+    # Fraction of memory.max_usage above which search asks the frontier to free memory.
+    LOW_MEMORY = 0.8
+    # The most states iterative_deepening_search records in its transposition table in one iteration.
+    TRANSPOSITION_TABLE_SIZE = 200000
+    
     @staticmethod
     def parse_level(server_messages) -> 'State':
         # We can assume that the level file is conforming to specification, since the server verifies this.
-        # Read domain.
-        server_messages.readline() # #domain
-        server_messages.readline() # hospital
-        
-        # Read Level name.
-        server_messages.readline() # #levelname
-        server_messages.readline() # <name>
+        # Read the whole level at once; the server keeps the stream open, so it is read up to #end rather than to EOF.
+        sections = {}
+        lines = None
+        for line in SearchClient.read_level(server_messages).splitlines():
+            if line.startswith('#'):
+                lines = sections[line[1:].strip()] = []
+            elif lines is not None:
+                lines.append(line)
         
         # Read colors.
-        server_messages.readline() # #colors
         agent_colors = [None for _ in range(10)]
         box_colors = [None for _ in range(26)]
-        line = server_messages.readline()
-        while not line.startswith('#'):
+        for line in sections['colors']:
             split = line.split(':')
             color = Color.from_string(split[0].strip())
             entities = [e.strip() for e in split[1].split(',')]
@@ -35,98 +54,476 @@ class SearchClient:
                     agent_colors[ord(e) - ord('0')] = color
                 elif 'A' <= e <= 'Z':
                     box_colors[ord(e) - ord('A')] = color
-            line = server_messages.readline()
         
-        # Read initial state.
-        # line is currently "#initial".
+        # Read initial state into grids of the size of the level, flattened row-major into cells.
+        initial = sections['initial']
+        num_rows = len(initial)
+        num_cols = max((len(line) for line in initial), default=0)
         num_agents = 0
-        agent_rows = [None for _ in range(10)]
-        agent_cols = [None for _ in range(10)]
-        walls = [[False for _ in range(130)] for _ in range(130)]
-        boxes = [['' for _ in range(130)] for _ in range(130)]
-        line = server_messages.readline()
-        row = 0
-        while not line.startswith('#'):
+        agent_cells = [None for _ in range(10)]
+        walls = bytearray(num_rows * num_cols)
+        boxes = []
+        for row, line in enumerate(initial):
             for col, c in enumerate(line):
                 if '0' <= c <= '9':
-                    agent_rows[ord(c) - ord('0')] = row
-                    agent_cols[ord(c) - ord('0')] = col
+                    agent_cells[ord(c) - ord('0')] = row * num_cols + col
                     num_agents += 1
                 elif 'A' <= c <= 'Z':
-                    boxes[row][col] = c
+                    boxes.append((c, row * num_cols + col))
                 elif c == '+':
-                    walls[row][col] = True
-            
-            row += 1
-            line = server_messages.readline()
-        del agent_rows[num_agents:]
-        del agent_rows[num_agents:]
+                    walls[row * num_cols + col] = 1
+        del agent_cells[num_agents:]
         
         # Read goal state.
-        # line is currently "#goal".
-        goals = [['' for _ in range(130)] for _ in range(130)]
-        line = server_messages.readline()
-        row = 0
-        while not line.startswith('#'):
-            for col, c in enumerate(line):
+        goals = ['' for _ in range(num_rows * num_cols)]
+        for row, line in enumerate(sections['goal'][:num_rows]):
+            for col, c in enumerate(line[:num_cols]):
                 if '0' <= c <= '9' or 'A' <= c <= 'Z':
-                    goals[row][col] = c
-            
-            row += 1
-            line = server_messages.readline()
-        
-        # End.
-        # line is currently "#end".
+                    goals[row * num_cols + col] = c
         
-        return State(agent_rows, agent_cols, agent_colors, walls, boxes, box_colors, goals)
+        # Boxes are numbered in order of letter, then cell, which keeps equal letters adjacent.
+        boxes.sort()
+        box_letters = ''.join(letter for letter, _ in boxes)
+        level = Level(bytes(walls), goals, agent_colors, box_colors, box_letters, num_rows, num_cols)
+        return State(level, array('h', agent_cells), array('h', (cell for _, cell in boxes)))
     
     @staticmethod
-    def search(initial_state: 'State', frontier: 'Frontier') -> '[[Action, ...], ...]':
+    def search(initial_state: 'State', frontier: 'Frontier', shuffle: 'bool' = False, monitor: 'Monitor' = None) -> '[[Action, ...], ...]':
         '''
         Implements the Graph-Search algorithm from R&N figure 3.7.
+        
+        Instead of an explored set of states, every state ever added to the frontier is interned in a NodeStore
+        (see nodestore.py), which serves as the reached set, and the frontier holds node ids. Successors are
+        generated as keys first, and a child state is only created if its key is new; the new children of an
+        expansion are added to the frontier together, so that it can evaluate them in one batch (see
+        Frontier.add_many). States are rebuilt from their keys when they are popped.
+        
+        A cheaper path to a state still in the frontier replaces the recorded one (see Frontier.update). States
+        already expanded are not expanded again, which only returns a shortest plan if every state is expanded with
+        its lowest g, as A* does with a consistent heuristic such as 'distance', 'matching' or 'pdb' (see Heuristic).
+        Frontiers that drop nodes can expand a state before the cheaper path to it is generated again. The state only
+        takes that path if it has no children left, like a state in the frontier; otherwise it keeps its record, from
+        which the nodes dropped below it are generated again (see FrontierMemoryBounded.shrink).
+        
+        Progress and memory usage are sampled and reported by monitor (see monitor.py), by default every 1000
+        expansions; the search stops once a sample exceeds memory.max_usage. Above LOW_MEMORY of that limit, the
+        frontier is asked to shrink, and the nodes it gives up are forgotten so they can be generated again.
         '''
         
-        start_time = time.perf_counter()
-        iterations = 0
+        if monitor is None:
+            monitor = Monitor()
+        explored = 0
         
         print('Starting {}.'.format(frontier.get_name()), file=sys.stderr, flush=True)
         
-        frontier.add(initial_state)
-        explored = set()
+        store = NodeStore(initial_state)
+        reached = store.index
+        frontier.add(store.add(initial_state.key(), NodeStore.NONE, None, initial_state.g, initial_state.unsatisfied_goals()), initial_state)
+        monitor.start(frontier)
         
-        while True:
-            if iterations == 1000:
-                SearchClient.print_search_status(start_time, explored, frontier)
-                iterations = 0
-            
-            if memory.get_usage() > memory.max_usage:
-                SearchClient.print_search_status(start_time, explored, frontier)
-                print('Maximum memory usage exceeded.', file=sys.stderr, flush=True)
-                return None
-            
-            if frontier.is_empty():
-                SearchClient.print_search_status(start_time, explored, frontier)
-                return None
-            
-            leaf_state = frontier.pop()
-            
-            if leaf_state.is_goal_state():
-                SearchClient.print_search_status(start_time, explored, frontier)
-                return leaf_state.extract_plan()
-            
-            explored.add(leaf_state)
-            for state in leaf_state.get_expanded_states():
-                if state not in explored and not frontier.contains(state):
-                    frontier.add(state)
+        try:
+            while True:
+                if monitor.tick(explored, len(store)):
+                    monitor.report('memory')
+                    print('Maximum memory usage exceeded.', file=sys.stderr, flush=True)
+                    return None
+                
+                if monitor.usage > SearchClient.LOW_MEMORY * memory.max_usage or frontier.is_full():
+                    for node in frontier.shrink(store):
+                        store.discard(node)
+                
+                if frontier.is_empty():
+                    monitor.report('exhausted')
+                    return None
+                
+                leaf = frontier.pop()
+                leaf_state = store.state(leaf)
+                
+                if leaf_state.is_goal_state():
+                    monitor.report('solved')
+                    return store.extract_plan(leaf)
+                
+                explored += 1
+                children = []
+                child_g = leaf_state.child_g()
+                for joint_action, key in leaf_state.successors(shuffle):
+                    node = reached.get(key)
+                    if node is None:
+                        child = leaf_state.apply_action(joint_action)
+                        children.append((store.add(key, leaf, joint_action, child.g, child.unsatisfied_goals()), child))
+                    elif child_g < store.g[node]:
+                        # Nodes in the frontier have no children; nodes with children keep their path, so that the
+                        # g of every node stays one step more than its parent's (see NodeStore.extract_plan).
+                        if store.children[node] == 0:
+                            store.update(node, leaf, joint_action, child_g)
+                            frontier.update(node, store.state(node))
+                frontier.add_many(children)
+        finally:
+            monitor.stop()
+    
+    # Weights of anytime search after the weight of -wastar, see anytime_weights.
+    ANYTIME_WEIGHTS = (5, 3, 2, 1)
+    
+    @staticmethod
+    def anytime_weights(w: 'int') -> '[int, ...]':
+        '''
+        Returns the weights of the iterations of anytime_search when starting from w: w, then every weight of
+        ANYTIME_WEIGHTS below it, down to 1.
+        '''
+        return [w] + [weight for weight in SearchClient.ANYTIME_WEIGHTS if weight < w]
+    
+    @staticmethod
+    def anytime_search(initial_state: 'State', heuristic: 'HeuristicWeightedAStar', weights: '[int, ...]', deadline: 'float', tie_breaking: 'str' = 'g-high', shuffle: 'bool' = False, monitor: 'Monitor' = None) -> '[[Action, ...], ...]':
+        '''
+        Implements restarting weighted A* (Richter, Thayer and Ruml, 2010): a WA* search with each of weights in turn,
+        every one restarted from the initial state, that returns the shortest plan found once the last search ends or
+        time.perf_counter() passes deadline, whichever is first. Without a plan, the search goes on past deadline.
+        
+        heuristic.w is set to each weight in turn. The searches share one NodeStore, with the best g and parent found
+        so far for every state, and the value of h of every state, computed once (in batches, see Heuristic.h_many).
+        A state reached in an earlier search is queued with what is known of it, and its path is improved whenever a
+        cheaper one is found, so later searches mostly re-order known states instead of generating them. Once a plan
+        is found, states whose g + h is not below its length are neither queued nor expanded.
+        
+        The first search, with a high weight, finds a plan quickly, and later searches lower the weight to find shorter
+        ones. The last search continues after finding a plan, until the frontier is exhausted or the deadline passes.
+        A search whose frontier is exhausted under the bound has shown, if the heuristic is admissible, that no plan is
+        shorter than the best one, which is then returned at once.
+        '''
+        
+        if monitor is None:
+            monitor = Monitor()
+        explored = 0
+        
+        print('Starting anytime search using {} with weights {}.'.format(heuristic, ', '.join(str(w) for w in weights)), file=sys.stderr, flush=True)
+        
+        store = NodeStore(initial_state)
+        reached = store.index
+        root = store.add(initial_state.key(), NodeStore.NONE, None, initial_state.g, initial_state.unsatisfied_goals())
+        h_values = array('i', heuristic.h_many([initial_state]))
+        best = None
+        monitor.start(None)
+        
+        try:
+            for iteration, w in enumerate(weights):
+                last = iteration == len(weights) - 1
+                heuristic.w = w
+                frontier = FrontierBestFirst(heuristic, tie_breaking)
+                monitor.frontier = frontier
+                # The nodes queued by this search; nodes reached by earlier searches are queued once they are generated.
+                queued = {root}
+                frontier.add_evaluated(root, initial_state, initial_state.g + w * h_values[root], h_values[root])
+                
+                while not frontier.is_empty():
+                    if monitor.tick(explored, len(store)):
+                        monitor.report('memory')
+                        print('Maximum memory usage exceeded.', file=sys.stderr, flush=True)
+                        return best
+                    
+                    if best is not None and time.perf_counter() > deadline:
+                        print('Deadline reached; using the plan of length {}.'.format(len(best)), file=sys.stderr, flush=True)
+                        monitor.report('solved')
+                        return best
+                    
+                    leaf = frontier.pop()
+                    if best is not None and store.g[leaf] + h_values[leaf] >= len(best):
+                        continue
+                    leaf_state = store.state(leaf)
+                    
+                    if leaf_state.is_goal_state():
+                        plan = store.extract_path(leaf)
+                        if best is None or len(plan) < len(best):
+                            best = plan
+                            monitor.report('plan')
+                            print('Found a plan of length {} with weight {}.'.format(len(best), w), file=sys.stderr, flush=True)
+                        if last:
+                            continue
+                        break
+                    
+                    explored += 1
+                    # Children with g + h of at least bound can not lead to a shorter plan than best.
+                    bound = len(best) if best is not None else None
+                    child_g = leaf_state.g + 1
+                    children = []
+                    for joint_action, key in leaf_state.successors(shuffle):
+                        node = reached.get(key)
+                        if node is None:
+                            child = leaf_state.apply_action(joint_action)
+                            node = store.add(key, leaf, joint_action, child.g, child.unsatisfied_goals())
+                            children.append((node, child))
+                            queued.add(node)
+                        elif child_g < store.g[node]:
+                            store.update(node, leaf, joint_action, child_g)
+                            queued.add(node)
+                            if bound is None or child_g + h_values[node] < bound:
+                                frontier.add_evaluated(node, store.state(node), child_g + w * h_values[node], h_values[node])
+                        elif node not in queued:
+                            queued.add(node)
+                            if bound is None or store.g[node] + h_values[node] < bound:
+                                frontier.add_evaluated(node, store.state(node), store.g[node] + w * h_values[node], h_values[node])
+                    
+                    if children:
+                        h_values.extend(heuristic.h_many([child for _, child in children]))
+                        for node, child in children:
+                            if bound is None or child.g + h_values[node] < bound:
+                                frontier.add_evaluated(node, child, child.g + w * h_values[node], h_values[node])
+                else:
+                    # Every state that could lead to a shorter plan has been expanded, so no search can improve on best.
+                    break
             
-            iterations += 1
+            monitor.report('solved' if best is not None else 'exhausted')
+            return best
+        finally:
+            monitor.stop()
     
     @staticmethod
-    def print_search_status(start_time: 'int', explored: '{State, ...}', frontier: 'Frontier') -> None:
-        status_template = '#Explored: {:8,}, #Frontier: {:8,}, #Generated: {:8,}, Time: {:3.3f} s\n[Alloc: {:4.2f} MB, MaxAlloc: {:4.2f} MB]'
-        elapsed_time = time.perf_counter() - start_time
-        print(status_template.format(len(explored), frontier.size(), len(explored) + frontier.size(), elapsed_time, memory.get_usage(), memory.max_usage), file=sys.stderr, flush=True)
-
+    def iterative_deepening_search(initial_state: 'State', heuristic: 'Heuristic', shuffle: 'bool' = False, monitor: 'Monitor' = None) -> '[[Action, ...], ...]':
+        '''
+        Implements IDA* (R&N section 3.5.3): repeated depth-first searches that only expand states with
+        heuristic.f(state) <= bound, raising the bound to the lowest f that exceeded it after every iteration.
+        
+        States on the current path are not generated again. Every iteration also keeps a transposition table with
+        the lowest g each state was searched with, and does not search a state again unless it is reached with a lower
+        g. The table holds at most TRANSPOSITION_TABLE_SIZE states, the first ones searched, and is cleared when the
+        bound is raised, so memory stays bounded; states reached along different paths beyond that are searched again,
+        trading time for memory.
+        '''
+        
+        if monitor is None:
+            monitor = Monitor()
+        explored = 0
+        generated = 1
+        
+        print('Starting iterative deepening search using {}.'.format(heuristic), file=sys.stderr, flush=True)
+        
+        if initial_state.is_goal_state():
+            return initial_state.extract_plan()
+        
+        bound = heuristic.f(initial_state)
+        monitor.start(None)
+        
+        try:
+            while True:
+                next_bound = None
+                path = {initial_state.key()}
+                table = {initial_state.key(): initial_state.g}
+                stack = [(initial_state, initial_state.successors(shuffle))]
+                explored += 1
+                
+                while stack:
+                    if monitor.tick(explored, generated):
+                        monitor.report('memory')
+                        print('Maximum memory usage exceeded.', file=sys.stderr, flush=True)
+                        return None
+                    
+                    state, successors = stack[-1]
+                    child_g = state.child_g()
+                    for joint_action, key in successors:
+                        if key in path or table.get(key, child_g + 1) <= child_g:
+                            continue
+                        
+                        child = state.apply_action(joint_action)
+                        generated += 1
+                        f = heuristic.f(child)
+                        if f > bound:
+                            if next_bound is None or f < next_bound:
+                                next_bound = f
+                            continue
+                        
+                        if child.is_goal_state():
+                            monitor.report('solved')
+                            return child.extract_plan()
+                        
+                        path.add(key)
+                        if key in table or len(table) < SearchClient.TRANSPOSITION_TABLE_SIZE:
+                            table[key] = child_g
+                        stack.append((child, child.successors(shuffle)))
+                        explored += 1
+                        break
+                    else:
+                        stack.pop()
+                        path.discard(state.key())
+                
+                if next_bound is None:
+                    monitor.report('exhausted')
+                    return None
+                bound = next_bound
+                monitor.report('bound')
+        finally:
+            monitor.stop()
+    
+    @staticmethod
+    def make_frontier(args, initial_state: 'State') -> 'Frontier':
+        # Select search strategy.
+        if args.bfs:
+            return FrontierBFS()
+        elif args.dfs:
+            return FrontierDFS()
+        elif args.astar:
+            return FrontierBestFirst(HeuristicAStar(initial_state, args.heuristic), args.tie_breaking)
+        elif args.wastar is not False:
+            return FrontierBestFirst(HeuristicWeightedAStar(initial_state, args.wastar, args.heuristic), args.tie_breaking)
+        elif args.greedy:
+            return FrontierBestFirst(HeuristicGreedy(initial_state, args.heuristic), args.tie_breaking)
+        elif args.smastar:
+            return FrontierMemoryBounded(HeuristicAStar(initial_state, args.heuristic), args.tie_breaking, args.frontier_capacity)
+        else:
+            # Default to BFS search.
+            return FrontierBFS()
+    
+    @staticmethod
+    def solve(args, initial_state: 'State') -> '[[Action, ...], ...]':
+        '''
+        Searches for a plan from initial_state with the strategy and options selected by args.
+        '''
+        # Optionally shuffle the order in which successors are generated, seeded for reproducibility.
+        if args.shuffle is not None:
+            State._RNG.seed(args.shuffle)
+        
+        # The deadline of anytime search is measured from here, i.e. once the level has been read.
+        if args.deadline is not None:
+            deadline = time.perf_counter() + args.deadline
+        
+        def solve(state: 'State') -> '[[Action, ...], ...]':
+            start = ODNode.root(state) if args.od else state
+            monitor = Monitor(args.monitor, args.monitor_interval, args.status_format)
+            if args.deadline is not None:
+                return SearchClient.anytime_search(state, HeuristicWeightedAStar(state, args.wastar, args.heuristic), SearchClient.anytime_weights(args.wastar), deadline, args.tie_breaking, args.shuffle is not None, monitor)
+            if args.idastar:
+                return SearchClient.iterative_deepening_search(start, HeuristicAStar(state, args.heuristic), args.shuffle is not None, monitor)
+            if args.bidirectional:
+                goals = goal_states(state)
+                if goals is not None:
+                    return bidirectional_search(state, goals, monitor)
+                print('Bidirectional search needs a single agent and as many goals as boxes of every letter; using BFS search.', file=sys.stderr, flush=True)
+            return SearchClient.search(start, SearchClient.make_frontier(args, state), args.shuffle is not None, monitor)
+        
+        if args.id:
+            return independence_detection(initial_state, solve)
+        return solve(initial_state)
+    
+    # Strategies run by -portfolio, as (description, arguments) pairs. With more workers than strategies, the
+    # strategies that shuffle successors are repeated with further seeds.
+    PORTFOLIO = (
+        ('greedy', {'greedy': True}),
+        ('WA*(5)', {'wastar': 5}),
+        ('A*', {'astar': True}),
+        ('greedy, shuffled', {'greedy': True, 'shuffle': 1}),
+        ('WA*(2)', {'wastar': 2}),
+        ('WA*(5), shuffled', {'wastar': 5, 'shuffle': 1}),
+        ('BFS', {'bfs': True}),
+        ('greedy, matching heuristic', {'greedy': True, 'heuristic': 'matching'}),
+        ('WA*(5), pattern databases', {'wastar': 5, 'heuristic': 'pdb'}),
+    )
+    # Seconds -portfolio waits for a result before checking that the workers are still running.
+    PORTFOLIO_POLL_INTERVAL = 1.0
+    
+    @staticmethod
+    def portfolio_configurations(args, count: 'int') -> '[(str, argparse.Namespace), ...]':
+        '''
+        Returns count (description, arguments) pairs for -portfolio: args with the strategy replaced by each
+        strategy of SearchClient.PORTFOLIO in turn.
+        '''
+        strategies = {'bfs': False, 'dfs': False, 'astar': False, 'wastar': False, 'greedy': False, 'idastar': False, 'smastar': False, 'bidirectional': False, 'portfolio': False, 'hdastar': False}
+        shuffled = [strategy for strategy in SearchClient.PORTFOLIO if 'shuffle' in strategy[1]]
+        configurations = []
+        for index in range(count):
+            if index < len(SearchClient.PORTFOLIO):
+                description, options = SearchClient.PORTFOLIO[index]
+            else:
+                description, options = shuffled[(index - len(SearchClient.PORTFOLIO)) % len(shuffled)]
+                seed = 2 + (index - len(SearchClient.PORTFOLIO)) // len(shuffled)
+                description, options = '{} (seed {})'.format(description, seed), dict(options, shuffle=seed)
+            configuration = argparse.Namespace(**vars(args))
+            for name, value in strategies.items():
+                setattr(configuration, name, value)
+            for name, value in options.items():
+                setattr(configuration, name, value)
+            configurations.append((description, configuration))
+        return configurations
+    
+    @staticmethod
+    def portfolio(args, level_text: 'str') -> '[[Action, ...], ...]':
+        '''
+        Runs the strategies of SearchClient.portfolio_configurations in args.portfolio processes, and returns the
+        first plan found. Each worker parses level_text itself, and the memory limit is divided evenly between the
+        workers.
+        
+        Workers send their (index, plan) to a result queue, and a worker that exits without sending one counts as
+        having found no plan. Once a plan arrives, the remaining workers are killed by a background thread, so that
+        the plan is returned without waiting for them to exit.
+        '''
+        count = max(1, args.portfolio)
+        configurations = SearchClient.portfolio_configurations(args, count)
+        print('Starting portfolio of {} strategies: {}.'.format(count, ', '.join(description for description, _ in configurations)), file=sys.stderr, flush=True)
+        
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=SearchClient._portfolio_worker, args=(index, level_text, configuration, args.max_memory / count, results), daemon=True) for index, (_, configuration) in enumerate(configurations)]
+        for worker in workers:
+            worker.start()
+        
+        def stop_workers():
+            for worker in workers:
+                worker.kill()
+            for worker in workers:
+                worker.join()
+        
+        plan = None
+        pending = set(range(count))
+        try:
+            while pending:
+                # A worker writes its result before it exits, so if one had exited before waiting and nothing arrived,
+                # it was killed (e.g. by the OS for its memory) and will never report.
+                exited = {index for index in pending if workers[index].exitcode is not None}
+                try:
+                    index, plan = results.get(timeout=SearchClient.PORTFOLIO_POLL_INTERVAL)
+                except queue.Empty:
+                    pending -= exited
+                    continue
+                pending.discard(index)
+                if plan is not None:
+                    print('Portfolio strategy {} found a plan first.'.format(configurations[index][0]), file=sys.stderr, flush=True)
+                    break
+        finally:
+            threading.Thread(target=stop_workers, name='portfolio-stop', daemon=True).start()
+        return plan
+    
+    @staticmethod
+    def _portfolio_worker(index: 'int', level_text: 'str', args, max_usage: 'float', results: 'multiprocessing.Queue'):
+        # The process object inherited from the parent would report the parent's memory.
+        memory._process = psutil.Process()
+        memory.max_usage = max_usage
+        plan = None
+        try:
+            plan = SearchClient.solve(args, SearchClient.parse_level(io.StringIO(level_text)))
+        finally:
+            results.put((index, plan))
+    
+    @staticmethod
+    def read_level(server_messages) -> 'str':
+        '''
+        Reads the level from server_messages up to and including the #end line, and returns it unparsed.
+        '''
+        lines = []
+        while True:
+            line = server_messages.readline()
+            lines.append(line)
+            if line.startswith('#end') or line == '':
+                return ''.join(lines)
+    
+    @staticmethod
+    def find_plan(args, server_messages) -> '[[Action, ...], ...]':
+        '''
+        Reads the level from server_messages and searches for a plan with the strategy selected by args.
+        '''
+        if args.portfolio is not False:
+            return SearchClient.portfolio(args, SearchClient.read_level(server_messages))
+        if args.hdastar is not False:
+            return hda_star_search(SearchClient.read_level(server_messages), SearchClient.parse_level, max(1, args.hdastar), args.heuristic, args.tie_breaking, args.shuffle, (args.monitor, args.monitor_interval, args.status_format))
+        if not (args.bfs or args.dfs or args.astar or args.wastar is not False or args.greedy or args.idastar or args.smastar or args.bidirectional):
+            print('Defaulting to BFS search. Use arguments -bfs, -dfs, -astar, -wastar, -greedy, -idastar, -smastar, -bidirectional, -portfolio, or -hdastar to set the search strategy.', file=sys.stderr, flush=True)
+        return SearchClient.solve(args, SearchClient.parse_level(server_messages))
+    
     @staticmethod
     def main(args) -> None:
         # Use stderr to print to the console.
@@ -142,27 +539,9 @@ class SearchClient:
         # Parse the level.
         server_messages = sys.stdin
         server_messages.reconfigure(encoding='ASCII')
-        initial_state = SearchClient.parse_level(server_messages)
-        
-        # Select search strategy.
-        frontier = None
-        if args.bfs:
-            frontier = FrontierBFS()
-        elif args.dfs:
-            frontier = FrontierDFS()
-        elif args.astar:
-            frontier = FrontierBestFirst(HeuristicAStar(initial_state))
-        elif args.wastar is not False:
-            frontier = FrontierBestFirst(HeuristicWeightedAStar(initial_state, args.wastar))
-        elif args.greedy:
-            frontier = FrontierBestFirst(HeuristicGreedy(initial_state))
-        else:
-            # Default to BFS search.
-            frontier = FrontierBFS()
-            print('Defaulting to BFS search. Use arguments -bfs, -dfs, -astar, -wastar, or -greedy to set the search strategy.', file=sys.stderr, flush=True)
         
         # Search for a plan.
-        plan = SearchClient.search(initial_state, frontier)
+        plan = SearchClient.find_plan(args, server_messages)
         
         # Print plan to server.
         if plan is None:
@@ -171,27 +550,111 @@ class SearchClient:
         else:
             print('Found solution of length {}.'.format(len(plan)), file=sys.stderr, flush=True)
             
-            for joint_action in plan:
-                print(";".join(a.name_ for a in joint_action), flush=True)
-                # We must read the server's response to not fill up the stdin buffer and block the server.
+            if args.pipeline is None:
+                for joint_action in plan:
+                    print(";".join(a.name_ for a in joint_action), flush=True)
+                    # We must read the server's response to not fill up the stdin buffer and block the server.
+                    response = server_messages.readline()
+            else:
+                SearchClient.send_plan(plan, server_messages, max(1, args.pipeline))
+    
+    @staticmethod
+    def send_plan(plan: '[[Action, ...], ...]', server_messages, batch_size: 'int'):
+        '''
+        Prints plan to the server batch_size joint actions at a time, without waiting for the response to each.
+        
+        The responses are read by a background thread as they arrive, so the server never blocks on a full stdin
+        buffer; once the whole plan is sent, the thread is joined and actions the server rejected are reported.
+        '''
+        failed = []
+        
+        def read_responses():
+            for step in range(len(plan)):
                 response = server_messages.readline()
+                if response == '':
+                    return
+                if 'false' in response:
+                    failed.append(step)
+        
+        reader = threading.Thread(target=read_responses, name='responses', daemon=True)
+        reader.start()
+        for start in range(0, len(plan), batch_size):
+            lines = (";".join(a.name_ for a in joint_action) for joint_action in plan[start:start + batch_size])
+            sys.stdout.write('\n'.join(lines) + '\n')
+            sys.stdout.flush()
+        reader.join()
+        
+        if failed:
+            print('The server rejected {} joint actions, the first at step {}.'.format(len(failed), failed[0]), file=sys.stderr, flush=True)
+    
+    @staticmethod
+    def parse_arguments(argv: '[str, ...]' = None) -> 'argparse.Namespace':
+        '''
+        Parses the program arguments in argv (default sys.argv), exiting with a usage message if they are invalid.
+        '''
+        parser = argparse.ArgumentParser(description='Simple client based on state-space graph search.')
+        parser.add_argument('--max-memory', metavar='<MB>', type=float, default=2048.0, help='The maximum memory usage allowed in MB (soft limit, default 2048).')
+        
+        strategy_group = parser.add_mutually_exclusive_group()
+        strategy_group.add_argument('-bfs', action='store_true', dest='bfs', help='Use the BFS strategy.')
+        strategy_group.add_argument('-dfs', action='store_true', dest='dfs', help='Use the DFS strategy.')
+        strategy_group.add_argument('-astar', action='store_true', dest='astar', help='Use the A* strategy.')
+        strategy_group.add_argument('-wastar', action='store', dest='wastar', nargs='?', type=int, default=False, const=5, help='Use the WA* strategy.')
+        strategy_group.add_argument('-greedy', action='store_true', dest='greedy', help='Use the Greedy strategy.')
+        strategy_group.add_argument('-idastar', action='store_true', dest='idastar', help='Use the IDA* strategy, which only keeps the current path and a bounded table of searched states in memory.')
+        strategy_group.add_argument('-smastar', action='store_true', dest='smastar', help='Use a simplified SMA* strategy: A* that drops the worst frontier states when memory runs low. Plans are not always shortest.')
+        strategy_group.add_argument('-bidirectional', action='store_true', dest='bidirectional', help='Use bidirectional BFS from the initial state and the goal states (single-agent levels).')
+        strategy_group.add_argument('-portfolio', action='store', dest='portfolio', nargs='?', type=int, default=False, const=os.cpu_count(), help='Run a portfolio of strategies in <n> processes (default one per core) and use the first plan found.')
+        strategy_group.add_argument('-hdastar', action='store', dest='hdastar', nargs='?', type=int, default=False, const=os.cpu_count(), help='Use hash-distributed A* (HDA*) in <n> processes (default one per core).')
+        
+        parser.add_argument('--heuristic', metavar='<name>', choices=Heuristic.METHODS, default='distance', help='The heuristic used by best-first strategies: goal-count, distance, matching, or pdb (default distance).')
+        parser.add_argument('--tie-breaking', metavar='<policy>', choices=FrontierBestFirst.TIE_BREAKING, default='g-high', help='How best-first strategies order states with equal f: g-high, h-low, fifo, or lifo (default g-high).')
+        parser.add_argument('--monitor', metavar='<mode>', choices=Monitor.MODES, default='iterations', help='When to sample memory usage and report progress: iterations, time, or thread (default iterations).')
+        parser.add_argument('--monitor-interval', metavar='<n>', type=float, default=None, help='Expansions between samples for --monitor iterations (default 1000), seconds otherwise (default 0.5).')
+        parser.add_argument('--status-format', metavar='<format>', choices=Monitor.FORMATS, default='text', help='Report progress as text or as JSON lines on stderr (default text).')
+        parser.add_argument('--od', action='store_true', help='Expand multi-agent states by operator decomposition: assign the agents their actions one at a time.')
+        parser.add_argument('--id', action='store_true', help='Use independence detection: plan independent groups of agents separately and merge their plans.')
+        parser.add_argument('--pipeline', metavar='<n>', nargs='?', type=int, default=None, const=64, help='Send the plan <n> joint actions at a time (default 64) and read the server\'s responses in the background. Off by default.')
+        parser.add_argument('--shuffle', metavar='<seed>', nargs='?', type=int, default=None, const=1, help='Generate the successors of each state in a random order, seeded with <seed> (default 1). Off by default.')
+        parser.add_argument('--deadline', metavar='<s>', type=float, default=None, help='With -wastar, keep searching for shorter plans with lower weights, and send the shortest found after <s> seconds. Off by default.')
+        parser.add_argument('--frontier-capacity', metavar='<n>', type=int, default=None, help='With -smastar, cap the frontier at <n> states from the start instead of when memory runs low, e.g. to test it on small levels. Off by default. Low values give longer plans, and can leave the search dropping and generating the same states until it runs out of time.')
+        parser.add_argument('--cache-dir', metavar='<dir>', default=None, help='Keep the distance tables, dead cells and action tables of levels in <dir>, and load them from there when the same level is solved again. Off by default.')
+        parser.add_argument('--numpy', action='store_true', help='Evaluate the heuristic of the best-first strategies on all new children of an expansion at once with NumPy, which is faster on levels with many boxes. Importing NumPy takes about 16 MB more memory. Off by default.')
+        parser.add_argument('--cache-size', metavar='<MB>', type=float, default=256.0, help='The maximum size of --cache-dir in MB; the least recently used entries are deleted above it (default 256).')
+        
+        args = parser.parse_args(argv)
+        if args.smastar and args.od:
+            parser.error('-smastar can not be combined with --od: dropped intermediate nodes can not be generated again from their parents.')
+        if args.bidirectional and args.od:
+            parser.error('-bidirectional can not be combined with --od.')
+        if args.hdastar is not False and (args.od or args.id):
+            parser.error('-hdastar can not be combined with --od or --id.')
+        if args.deadline is not None and args.wastar is False:
+            parser.error('--deadline requires -wastar.')
+        if args.deadline is not None and (args.od or args.id):
+            parser.error('--deadline can not be combined with --od or --id.')
+        if args.frontier_capacity is not None and not args.smastar:
+            parser.error('--frontier-capacity requires -smastar.')
+        if args.frontier_capacity is not None and args.frontier_capacity < 1:
+            parser.error('--frontier-capacity must be at least 1.')
+        if args.numpy and not HAVE_NUMPY:
+            parser.error('--numpy requires the numpy package.')
+        
+        return args
 
 if __name__ == '__main__':
     # Program arguments.
-    parser = argparse.ArgumentParser(description='Simple client based on state-space graph search.')
-    parser.add_argument('--max-memory', metavar='<MB>', type=float, default=2048.0, help='The maximum memory usage allowed in MB (soft limit, default 2048).')
-    
-    strategy_group = parser.add_mutually_exclusive_group()
-    strategy_group.add_argument('-bfs', action='store_true', dest='bfs', help='Use the BFS strategy.')
-    strategy_group.add_argument('-dfs', action='store_true', dest='dfs', help='Use the DFS strategy.')
-    strategy_group.add_argument('-astar', action='store_true', dest='astar', help='Use the A* strategy.')
-    strategy_group.add_argument('-wastar', action='store', dest='wastar', nargs='?', type=int, default=False, const=5, help='Use the WA* strategy.')
-    strategy_group.add_argument('-greedy', action='store_true', dest='greedy', help='Use the Greedy strategy.')
-    
-    args = parser.parse_args()
+    args = SearchClient.parse_arguments()
     
     # Set max memory usage allowed (soft limit).
     memory.max_usage = args.max_memory
     
+    # Set the preprocessing cache.
+    cache.directory = args.cache_dir
+    cache.max_size = args.cache_size * 1024 * 1024
+    
+    # Set whether the heuristic is evaluated in batches with NumPy.
+    heuristic.use_numpy = args.numpy
+    
     # Run client.
     SearchClient.main(args)
@@ -0,0 +1,57 @@
+from action import Action
+
+class Simulator:
+    '''
+    Executes joint actions in process, with the rules the server applies and the rules of the search
+    (State.is_applicable and State.is_conflicting): actions that are not applicable fail, as do all actions
+    that conflict with another applicable action, by moving into the same cell or moving the same box.
+    Failed actions are replaced by NoOp, and the others are executed.
+    
+    execute returns the success of every action, like the line the server sends back for every joint action,
+    so plans can be tested without the server round trip.
+    '''
+    def __init__(self, initial_state: 'State'):
+        self.state = initial_state
+        self.steps = 0
+    
+    def execute(self, joint_action: '[Action, ...]') -> '[bool, ...]':
+        state = self.state
+        num_agents = len(state.agents)
+        if len(joint_action) != num_agents:
+            raise ValueError('{} actions for {} agents.'.format(len(joint_action), num_agents))
+        
+        succeeded = [state.is_applicable(agent, action) for agent, action in enumerate(joint_action)]
+        if num_agents > 1:
+            applied = [action if success else Action.NoOp for action, success in zip(joint_action, succeeded)]
+            if state.is_conflicting(applied):
+                for a1 in range(num_agents):
+                    for a2 in range(a1 + 1, num_agents):
+                        pair = [Action.NoOp for _ in range(num_agents)]
+                        pair[a1] = applied[a1]
+                        pair[a2] = applied[a2]
+                        if state.is_conflicting(pair):
+                            succeeded[a1] = succeeded[a2] = False
+        
+        self.state = state.apply_action([action if success else Action.NoOp for action, success in zip(joint_action, succeeded)])
+        self.steps += 1
+        return succeeded
+    
+    def is_solved(self) -> 'bool':
+        return self.state.is_goal_state()
+
+def validate_plan(initial_state: 'State', plan: '[[Action, ...], ...]') -> 'str':
+    '''
+    Replays plan from initial_state in a Simulator, and returns None if every action succeeds and the last state
+    is a goal state, or else a description of the first problem.
+    '''
+    simulator = Simulator(initial_state)
+    for step, joint_action in enumerate(plan):
+        if len(joint_action) != len(initial_state.agents):
+            return 'Step {}: {} actions for {} agents.'.format(step, len(joint_action), len(initial_state.agents))
+        succeeded = simulator.execute(joint_action)
+        if not all(succeeded):
+            failed = ', '.join('{} of agent {}'.format(action.name_, agent) for agent, (action, success) in enumerate(zip(joint_action, succeeded)) if not success)
+            return 'Step {}: {} failed.'.format(step, failed)
+    if not simulator.is_solved():
+        return 'The plan does not end in a goal state.'
+    return None
@@ -1,41 +1,47 @@
+import itertools
 import random
+from array import array
 
 from action import Action, ActionType
 
 class State:
+    __slots__ = ('level', 'agents', 'boxes', 'parent', 'joint_action', 'g', '_hash', '_unsatisfied', '_occupancy')
+    
     _RNG = random.Random(1)
+    _0, _9, _A, _Z = ord('0'), ord('9'), ord('A'), ord('Z')
     
-    def __init__(self, agent_rows, agent_cols, agent_colors, walls, boxes, box_colors, goals):
+    def __init__(self, level: 'Level', agents: 'array', boxes: 'array'):
         '''
         Constructs an initial state.
         Arguments are not copied, and therefore should not be modified after being passed in.
         
-        The lists walls, boxes, and goals are indexed from top-left of the level, row-major order (row, col).
+        The static parts of the level (walls, goals, colors and dimensions) live in the shared Level object,
+        so a state only carries the parts that change during search: agent positions and box placement.
+        
+        Positions are cell indices into the level, row-major order: cell = row * level.num_cols + col.
                Col 0  Col 1  Col 2  Col 3
-        Row 0: (0,0)  (0,1)  (0,2)  (0,3)  ...
-        Row 1: (1,0)  (1,1)  (1,2)  (1,3)  ...
-        Row 2: (2,0)  (2,1)  (2,2)  (2,3)  ...
+        Row 0:   0      1      2      3    ...
+        Row 1:   w     w+1    w+2    w+3   ...
         ...
         
-        For example, self.walls[2] is a list of booleans for the third row.
-        self.walls[row][col] is True if there's a wall at (row, col).
+        The agents array is indexed by the agent number and holds the cell of each agent.
+        For example, self.agents[0] is the cell of agent '0'.
         
-        The agent rows, columns, and colors are indexed by the agent number.
-        For example, self.agent_rows[0] is the row location of agent '0'.
+        The boxes array is indexed by box number and holds the cell of each box; the letter of box i is
+        level.box_letters[i]. Boxes of the same letter are interchangeable, so their cells are kept sorted
+        within each letter to give every box placement a single representation.
         
         Note: The state should be considered immutable after it has been hashed, e.g. added to a dictionary or set.
         '''
-        self.agent_rows = agent_rows
-        self.agent_cols = agent_cols
-        self.agent_colors = agent_colors
-        self.walls = walls
+        self.level = level
+        self.agents = agents
         self.boxes = boxes
-        self.box_colors = box_colors
-        self.goals = goals
         self.parent = None
         self.joint_action = None
         self.g = 0
         self._hash = None
+        self._unsatisfied = None
+        self._occupancy = None
     
     def apply_action(self, joint_action: '[Action, ...]') -> 'State':
         '''
@@ -43,166 +49,289 @@ class State:
         Precondition: Joint action must be applicable and non-conflicting in this state.
         '''
         
-        # Copy this state.
-        copy_agent_rows = self.agent_rows[:]
-        copy_agent_cols = self.agent_cols[:]
-        copy_agent_colors = self.agent_colors[:]
-        copy_walls = [row[:] for row in self.walls]
-        copy_boxes = [row[:] for row in self.boxes]
-        copy_box_colors = self.box_colors[:]
-        copy_goals = [row[:] for row in self.goals]
+        # Copy the dynamic part of this state with the actions applied; the level is shared.
+        copy_agents, copy_boxes = self._child_arrays(joint_action)
+        agent_keys = self.level.agent_keys
+        box_keys = self.level.box_keys
+        agent_goal_cells = self.level.agent_goal_cells
+        box_goal_at = self.level.box_goal_at
+        box_letters = self.level.box_letters
         
-        # Apply each action.
+        # Update the number of unsatisfied goals for every moved agent and box, and the Zobrist hash if this state
+        # has been hashed; otherwise the child is only hashed if it is needed (see __hash__).
+        _hash = self._hash
+        unsatisfied = self.unsatisfied_goals()
         for agent, action in enumerate(joint_action):
             if action.type is ActionType.NoOp:
-                pass
-            
-            elif action.type is ActionType.Move:
-                copy_agent_rows[agent] += action.agent_row_delta
-                copy_agent_cols[agent] += action.agent_col_delta
+                continue
             
-            elif action.type is ActionType.Push:
-                copy_agent_rows[agent] += action.agent_row_delta
-                copy_agent_cols[agent] += action.agent_col_delta
-                box = copy_boxes[copy_agent_rows[agent]][copy_agent_cols[agent]]
-                copy_boxes[copy_agent_rows[agent]][copy_agent_cols[agent]] = ''
-                copy_boxes[copy_agent_rows[agent] + action.box_row_delta]\
-                          [copy_agent_cols[agent] + action.box_col_delta] = box
+            agent_cell = self.agents[agent]
+            destination, box_cell, box_destination = self._action_cells(agent, action)
+            if _hash is not None:
+                _hash ^= agent_keys[agent][agent_cell] ^ agent_keys[agent][destination]
+            if agent_goal_cells[agent] == agent_cell: unsatisfied += 1
+            elif agent_goal_cells[agent] == destination: unsatisfied -= 1
             
-            elif action.type is ActionType.Pull:
-                box = copy_boxes[copy_agent_rows[agent] + action.box_row_delta]\
-                                [copy_agent_cols[agent] + action.box_col_delta]
-                copy_boxes[copy_agent_rows[agent] + action.box_row_delta]\
-                          [copy_agent_cols[agent] + action.box_col_delta] = ''
-                copy_boxes[copy_agent_rows[agent]][copy_agent_cols[agent]] = box
-                copy_agent_rows[agent] += action.agent_row_delta
-                copy_agent_cols[agent] += action.agent_col_delta
+            if box_cell is not None:
+                box = self.boxes.index(box_cell)
+                if _hash is not None:
+                    _hash ^= box_keys[box][box_cell] ^ box_keys[box][box_destination]
+                if box_goal_at[box_cell] == box_letters[box]: unsatisfied += 1
+                if box_goal_at[box_destination] == box_letters[box]: unsatisfied -= 1
         
-        copy_state = State(copy_agent_rows, copy_agent_cols, copy_agent_colors, copy_walls, copy_boxes, copy_box_colors, copy_goals)
+        copy_state = State(self.level, copy_agents, copy_boxes)
         
+        copy_state._hash = _hash
+        copy_state._unsatisfied = unsatisfied
         copy_state.parent = self
-        copy_state.joint_action = joint_action[:]
+        copy_state.joint_action = list(joint_action)
         copy_state.g = self.g + 1
         
         return copy_state
     
+    def _action_cells(self, agent: 'int', action: 'Action') -> '(int, int, int)':
+        '''
+        Returns (agent destination, box cell, box destination) of action for agent.
+        The box cells are None if action does not move a box.
+        '''
+        agent_cell = self.agents[agent]
+        if action.type is ActionType.NoOp:
+            return agent_cell, None, None
+        
+        destination = agent_cell + self.level.agent_deltas[action.index]
+        if action.type is ActionType.Move:
+            return destination, None, None
+        elif action.type is ActionType.Push:
+            return destination, destination, destination + self.level.box_deltas[action.index]
+        else:
+            return destination, agent_cell + self.level.box_deltas[action.index], agent_cell
+    
+    def _child_arrays(self, joint_action: '[Action, ...]') -> '(array, array)':
+        '''
+        Returns copies of the agents and boxes arrays with joint_action applied.
+        '''
+        return self._moved_arrays([self._action_cells(agent, action) for agent, action in enumerate(joint_action)])
+    
+    def _moved_arrays(self, cells: '[(int, int, int), ...]') -> '(array, array)':
+        '''
+        Returns copies of the agents and boxes arrays with every agent moved to cells[agent] = (agent destination,
+        box cell, box destination), as returned by _action_cells, and the box at box cell, if any, moved along.
+        '''
+        agents = self.agents[:]
+        boxes = self.boxes[:]
+        moved_groups = []
+        for agent, (destination, box_cell, box_destination) in enumerate(cells):
+            agents[agent] = destination
+            if box_cell is not None:
+                box = self.boxes.index(box_cell)
+                boxes[box] = box_destination
+                moved_groups.append(self.level.box_groups[box])
+        for group in moved_groups:
+            State._sort_box_group(boxes, group)
+        return agents, boxes
+    
+    def child_key(self, joint_action: '[Action, ...]') -> 'bytes':
+        '''
+        Returns the key() of apply_action(joint_action) without creating the child state.
+        '''
+        agents, boxes = self._child_arrays(joint_action)
+        return agents.tobytes() + boxes.tobytes()
+    
+    def child_hash(self, joint_action: '[Action, ...]') -> 'int':
+        '''
+        Returns the hash of apply_action(joint_action) without creating the child state, by updating the hash of
+        this state with the Zobrist keys of the moved agents and boxes, as apply_action does.
+        '''
+        agent_keys = self.level.agent_keys
+        box_keys = self.level.box_keys
+        _hash = self.__hash__()
+        for agent, action in enumerate(joint_action):
+            if action.type is ActionType.NoOp:
+                continue
+            destination, box_cell, box_destination = self._action_cells(agent, action)
+            _hash ^= agent_keys[agent][self.agents[agent]] ^ agent_keys[agent][destination]
+            if box_cell is not None:
+                keys = box_keys[self.boxes.index(box_cell)]
+                _hash ^= keys[box_cell] ^ keys[box_destination]
+        return _hash
+    
+    @staticmethod
+    def from_key(level: 'Level', key: 'bytes') -> 'State':
+        '''
+        Returns a new initial state with the agents and boxes packed in key, as returned by key().
+        '''
+        agents = array('h')
+        boxes = array('h')
+        split = len(key) - len(level.box_letters) * boxes.itemsize
+        agents.frombytes(key[:split])
+        boxes.frombytes(key[split:])
+        return State(level, agents, boxes)
+    
+    def restore(self, key: 'bytes', g: 'int', unsatisfied: 'int' = None) -> 'State':
+        '''
+        Returns the state of this level with the agents and boxes packed in key, g and the number of unsatisfied
+        goals (if not None) set, for NodeStore.state. The state has no parent, so plans are extracted from the store.
+        '''
+        state = State.from_key(self.level, key)
+        state.g = g
+        state._unsatisfied = unsatisfied
+        return state
+    
+    def child_g(self) -> 'int':
+        '''
+        Returns the g of the children of this state, without creating them.
+        '''
+        return self.g + 1
+    
+    def key(self) -> 'bytes':
+        '''
+        Returns the agents and boxes of this state packed into bytes. Two states are equal if and only if their keys are.
+        '''
+        return self.agents.tobytes() + self.boxes.tobytes()
+    
+    @staticmethod
+    def _sort_box_group(boxes: 'array', group: '(int, int)'):
+        start, end = group
+        if end - start > 1:
+            boxes[start:end] = array('h', sorted(boxes[start:end]))
+    
+    def unsatisfied_goals(self) -> 'int':
+        '''
+        Returns the number of goals without the right box or agent on them.
+        apply_action derives the count of a child from its parent, and NodeStore.state restores the count it stored,
+        so only initial states (and states restored without a count) count from scratch.
+        '''
+        if self._unsatisfied is None:
+            unsatisfied = 0
+            for cell, goal in self.level.goal_cells:
+                if 'A' <= goal <= 'Z' and self.box_at(cell) != goal:
+                    unsatisfied += 1
+                elif '0' <= goal <= '9' and self.agents[ord(goal) - ord('0')] != cell:
+                    unsatisfied += 1
+            self._unsatisfied = unsatisfied
+        return self._unsatisfied
+    
     def is_goal_state(self) -> 'bool':
-        for row in range(len(self.goals)):
-            for col in range(len(self.goals[row])):
-                goal = self.goals[row][col]
-                
-                if 'A' <= goal <= 'Z' and self.boxes[row][col] != goal:
-                    return False
-                elif '0' <= goal <= '9' and not (self.agent_rows[ord(goal) - ord('0')] == row and self.agent_cols[ord(goal) - ord('0')] == col):
-                    return False
-        return True
+        return self.unsatisfied_goals() == 0
     
-    def get_expanded_states(self) -> '[State, ...]':
-        num_agents = len(self.agent_rows)
+    def successors(self, shuffle: 'bool' = False) -> '[([Action, ...], bytes), ...]':
+        '''
+        Lazily generates (joint_action, key) for every child of this state, where key is the child's key().
+        No child states are created; callers check key against the states they have seen and only call
+        apply_action(joint_action) for new ones.
         
-        # Determine list of applicable action for each individual agent.
-        applicable_actions = [[action for action in Action if self.is_applicable(agent, action)] for agent in range(num_agents)]
+        Joint actions are enumerated in Action order per agent, unless shuffle is True, in which case the actions
+        of each agent are shuffled with State._RNG first. Seed State._RNG for reproducible shuffles.
+        '''
+        num_agents = len(self.agents)
         
-        # Iterate over joint actions, check conflict and generate child states.
-        joint_action = [None for _ in range(num_agents)]
-        actions_permutation = [0 for _ in range(num_agents)]
-        expanded_states = []
-        while True:
-            for agent in range(num_agents):
-                joint_action[agent] = applicable_actions[agent][actions_permutation[agent]]
-            
-            if not self.is_conflicting(joint_action):
-                expanded_states.append(self.apply_action(joint_action))
-            
-            # Advance permutation.
-            done = False
-            for agent in range(num_agents):
-                if actions_permutation[agent] < len(applicable_actions[agent]) - 1:
-                    actions_permutation[agent] += 1
-                    break
-                else:
-                    actions_permutation[agent] = 0
-                    if agent == num_agents - 1:
-                        done = True
+        # Determine list of applicable action for each individual agent, skipping moves of boxes into dead cells.
+        applicable_actions = [self.get_applicable_actions(agent) for agent in range(num_agents)]
+        if shuffle:
+            for actions in applicable_actions:
+                State._RNG.shuffle(actions)
+        
+        # The cells of every action, computed once per agent rather than once per joint action, with the cell each
+        # action claims and the box it moves (see is_conflicting); NoOp claims nothing.
+        options = []
+        for agent, actions in enumerate(applicable_actions):
+            agent_options = []
+            for action in actions:
+                cells = self._action_cells(agent, action)
+                claim = None if action is Action.NoOp else cells[2] if action.type is ActionType.Push else cells[0]
+                agent_options.append((action, cells, claim, cells[1]))
+            options.append(agent_options)
+        
+        try:
+            if num_agents == 1:
+                for action, cells, _, _ in options[0]:
+                    agents, boxes = self._moved_arrays((cells,))
+                    yield (action,), agents.tobytes() + boxes.tobytes()
+                return
             
-            # Last permutation?
-            if done:
-                break
+            # Iterate over joint actions, check conflict and generate child keys.
+            for joint_options in itertools.product(*options):
+                claims = [claim for _, _, claim, _ in joint_options if claim is not None]
+                if len(set(claims)) != len(claims):
+                    continue
+                moved_boxes = [box_cell for _, _, _, box_cell in joint_options if box_cell is not None]
+                if len(set(moved_boxes)) != len(moved_boxes):
+                    continue
+                agents, boxes = self._moved_arrays([cells for _, cells, _, _ in joint_options])
+                yield tuple(action for action, _, _, _ in joint_options), agents.tobytes() + boxes.tobytes()
+        finally:
+            self.discard_occupancy()
+    
+    def get_applicable_actions(self, agent: 'int') -> '[Action, ...]':
+        '''
+        Returns the actions applicable for agent that do not move a box onto a dead cell.
+        Equivalent to filtering Action with is_applicable and dropping the pushes and pulls onto dead cells (see
+        Level.dead_cells), but only visits the actions that the level's precomputed tables allow from the agent's cell.
+        '''
+        level = self.level
+        agent_cell = self.agents[agent]
+        agent_color = level.agent_colors[agent]
+        box_colors = level.box_colors
+        dead_cells = level.dead_cells
+        occupancy = self.occupancy()
+        _A, _Z = State._A, State._Z
         
-        State._RNG.shuffle(expanded_states)
-        return expanded_states
+        actions = [Action.NoOp]
+        for action, destination in level.moves[agent_cell]:
+            if occupancy[destination] == 0:
+                actions.append(action)
+        for action, box_cell, box_destination in level.pushes[agent_cell]:
+            box = occupancy[box_cell]
+            if _A <= box <= _Z and occupancy[box_destination] == 0 and box_colors[box - _A] is agent_color:
+                dead = dead_cells[box - _A]
+                if dead is None or not dead[box_destination]:
+                    actions.append(action)
+        for action, destination, box_cell in level.pulls[agent_cell]:
+            box = occupancy[box_cell]
+            if _A <= box <= _Z and occupancy[destination] == 0 and box_colors[box - _A] is agent_color:
+                dead = dead_cells[box - _A]
+                if dead is None or not dead[agent_cell]:
+                    actions.append(action)
+        return actions
     
     def is_applicable(self, agent: 'int', action: 'Action') -> 'bool':
-        agent_row = self.agent_rows[agent]
-        agent_col = self.agent_cols[agent]
-        agent_color = self.agent_colors[agent]
-        
         if action.type is ActionType.NoOp:
             return True
-            
-        elif action.type is ActionType.Move:
-            destination_row = agent_row + action.agent_row_delta
-            destination_col = agent_col + action.agent_col_delta
-            return self.is_free(destination_row, destination_col)
-            
+        
+        level = self.level
+        agent_cell = self.agents[agent]
+        agent_color = level.agent_colors[agent]
+        occupancy = self.occupancy()
+        destination = agent_cell + level.agent_deltas[action.index]
+        
+        if action.type is ActionType.Move:
+            return occupancy[destination] == 0
+        
         elif action.type is ActionType.Push:
-            box_row = agent_row + action.agent_row_delta
-            box_col = agent_col + action.agent_col_delta
-            box = self.boxes[box_row][box_col]
-            if box == '' or agent_color is not self.box_colors[ord(box) - ord('A')]:
+            box = occupancy[destination]
+            if not State._A <= box <= State._Z or agent_color is not level.box_colors[box - State._A]:
                 return False
-            destination_row = box_row + action.box_row_delta
-            destination_col = box_col + action.box_col_delta
-            return self.is_free(destination_row, destination_col)
-            
+            return occupancy[destination + level.box_deltas[action.index]] == 0
+        
         elif action.type is ActionType.Pull:
-            box_row = agent_row + action.box_row_delta
-            box_col = agent_col + action.box_col_delta
-            box = self.boxes[box_row][box_col]
-            if box == '' or agent_color is not self.box_colors[ord(box) - ord('A')]:
+            box = occupancy[agent_cell + level.box_deltas[action.index]]
+            if not State._A <= box <= State._Z or agent_color is not level.box_colors[box - State._A]:
                 return False
-            destination_row = agent_row + action.agent_row_delta
-            destination_col = agent_col + action.agent_col_delta
-            return self.is_free(destination_row, destination_col)
+            return occupancy[destination] == 0
     
     def is_conflicting(self, joint_action: '[Action, ...]') -> 'bool':
-        num_agents = len(self.agent_rows)
+        num_agents = len(self.agents)
         
-        destination_rows = [None for _ in range(num_agents)]
-        destination_cols = [None for _ in range(num_agents)]
-        box_rows = [None for _ in range(num_agents)]
-        box_cols = [None for _ in range(num_agents)]
+        destinations = [None for _ in range(num_agents)]
+        box_cells = [None for _ in range(num_agents)]
         
         # Collect cells to be occupied and boxes to be moved.
         for agent in range(num_agents):
             action = joint_action[agent]
-            agent_row = self.agent_rows[agent]
-            agent_col = self.agent_cols[agent]
-            
-            if action.type is ActionType.NoOp:
-                pass
-            
-            elif action.type is ActionType.Move:
-                destination_rows[agent] = agent_row + action.agent_row_delta
-                destination_cols[agent] = agent_col + action.agent_col_delta
-                box_rows[agent] = agent_row # Distinct dummy value.
-                box_cols[agent] = agent_col # Distinct dummy value.
-            
-            elif action.type is ActionType.Push:
-                box_row = agent_row + action.agent_row_delta
-                box_col = agent_col + action.agent_col_delta
-                box_rows[agent] = box_row
-                box_cols[agent] = box_col
-                destination_rows[agent] = box_row + action.box_row_delta
-                destination_cols[agent] = box_col + action.box_col_delta
-            
-            elif action.type is ActionType.Pull:
-                box_row = agent_row + action.box_row_delta
-                box_col = agent_col + action.box_col_delta
-                box_rows[agent] = box_row
-                box_cols[agent] = box_col
-                destination_rows[agent] = agent_row + action.agent_row_delta
-                destination_cols[agent] = agent_col + action.agent_col_delta
+            destination, box_cell, box_destination = self._action_cells(agent, action)
+            # A push occupies the cell the box moves to; the agent moves into the cell the box leaves.
+            destinations[agent] = box_destination if action.type is ActionType.Push else destination
+            box_cells[agent] = box_cell if box_cell is not None else self.agents[agent] # Distinct dummy value.
         
         for a1 in range(num_agents):
             if joint_action[a1] is Action.NoOp:
@@ -213,24 +342,52 @@ class State:
                     continue
                 
                 # Moving into same cell?
-                if destination_rows[a1] == destination_rows[a2] and destination_cols[a1] == destination_cols[a2]:
+                if destinations[a1] == destinations[a2]:
                     return True
                 
                 # Moving same box?
-                if box_rows[a1] == box_rows[a2] and box_cols[a1] == box_cols[a2]:
+                if box_cells[a1] == box_cells[a2]:
                     return True
         
         return False
     
-    def is_free(self, row: 'int', col: 'int') -> 'bool':
-        return not self.walls[row][col] and self.boxes[row][col] == '' and self.agent_at(row, col) is None
+    def occupancy(self) -> 'bytearray':
+        '''
+        Returns a grid over the cells of the level holding what occupies each cell: ord('+') for walls, the
+        character code of the agent number or box letter for agents and boxes, and 0 for free cells.
+        The grid is built on first use and cached until the state has been expanded.
+        '''
+        if self._occupancy is None:
+            occupancy = bytearray(self.level.wall_occupancy)
+            for agent, cell in enumerate(self.agents):
+                occupancy[cell] = State._0 + agent
+            for box, cell in enumerate(self.boxes):
+                occupancy[cell] = self.level.box_codes[box]
+            self._occupancy = occupancy
+        return self._occupancy
     
-    def agent_at(self, row: 'int', col: 'int') -> 'char':
-        for agent in range(len(self.agent_rows)):
-            if self.agent_rows[agent] == row and self.agent_cols[agent] == col:
-                return chr(agent + ord('0'))
+    def discard_occupancy(self):
+        '''
+        Drops the occupancy grid, which is only needed while expanding; it is rebuilt on demand. Call this once a
+        state is expanded, so that explored states kept alive as parents don't each hold a grid.
+        '''
+        self._occupancy = None
+    
+    def is_free(self, cell: 'int') -> 'bool':
+        return self.occupancy()[cell] == 0
+    
+    def agent_at(self, cell: 'int') -> 'char':
+        occupant = self.occupancy()[cell]
+        if State._0 <= occupant <= State._9:
+            return chr(occupant)
         return None
     
+    def box_at(self, cell: 'int') -> 'char':
+        occupant = self.occupancy()[cell]
+        if State._A <= occupant <= State._Z:
+            return chr(occupant)
+        return ''
+    
     def extract_plan(self) -> '[Action, ...]':
         plan = [None for _ in range(self.g)]
         state = self
@@ -240,39 +397,17 @@ class State:
         return plan
     
     def __hash__(self):
+        # States are hashed from scratch on first use; apply_action derives the hash of a child from a hashed parent.
         if self._hash is None:
-            prime = 31
-            _hash = 1
-            _hash = _hash * prime + hash(tuple(self.agent_rows))
-            _hash = _hash * prime + hash(tuple(self.agent_cols))
-            _hash = _hash * prime + hash(tuple(self.agent_colors))
-            _hash = _hash * prime + hash(tuple(tuple(row) for row in self.boxes))
-            _hash = _hash * prime + hash(tuple(self.box_colors))
-            _hash = _hash * prime + hash(tuple(tuple(row) for row in self.goals))
-            _hash = _hash * prime + hash(tuple(tuple(row) for row in self.walls))
-            self._hash = _hash
+            self._hash = self.level.zobrist_hash(self.agents, self.boxes)
         return self._hash
     
     def __eq__(self, other):
         if self is other: return True
         if not isinstance(other, State): return False
-        if self.agent_rows != other.agent_rows: return False
-        if self.agent_cols != other.agent_cols: return False
-        if self.agent_colors != other.agent_colors: return False
-        if self.walls != other.walls: return False
-        if self.boxes != other.boxes: return False
-        if self.box_colors != other.box_colors: return False
-        if self.goals != other.goals: return False
-        return True
+        return self.agents == other.agents and self.boxes == other.boxes
     
     def __repr__(self):
-        lines = []
-        for row in range(len(self.boxes)):
-            line = []
-            for col in range(len(self.boxes[row])):
-                if self.boxes[row][col] != '': line.append(self.boxes[row][col])
-                elif self.walls[row][col] is not None: line.append('+')
-                elif self.agent_at(row, col) is not None: line.append(self.agent_at(row, col))
-                else: line.append(' ')
-            lines.append(''.join(line))
-        return '\n'.join(lines)
+        num_cols = self.level.num_cols
+        grid = self.occupancy().replace(b'\0', b' ').decode('ascii')
+        return '\n'.join(grid[row * num_cols:(row + 1) * num_cols] for row in range(self.level.num_rows))
@@ -0,0 +1,41 @@
+import os
+import sys
+import unittest
+
+SEARCHCLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'searchclient')
+LEVELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'levels')
+sys.path.insert(0, SEARCHCLIENT_DIR)
+
+from frontier import FrontierMemoryBounded
+from heuristic import HeuristicAStar
+from searchclient import SearchClient
+from simulator import validate_plan
+
+def parse_level(name: 'str') -> 'State':
+    with open(os.path.join(LEVELS_DIR, name + '.lvl')) as level_file:
+        return SearchClient.parse_level(level_file)
+
+class TestMemoryBoundedSearch(unittest.TestCase):
+    '''
+    Runs -smastar with a frontier capacity far below the number of states it expands, so that nodes are dropped and
+    generated again many times, and checks that it still finds a valid plan.
+    '''
+    def solve(self, name: 'str', capacity: 'int') -> '[[Action, ...], ...]':
+        initial_state = parse_level(name)
+        frontier = FrontierMemoryBounded(HeuristicAStar(initial_state), capacity=capacity)
+        plan = SearchClient.search(initial_state, frontier)
+        self.assertIsNotNone(plan, '{} with capacity {} found no plan.'.format(name, capacity))
+        self.assertIsNone(validate_plan(parse_level(name), plan))
+        return plan
+    
+    def test_single_agent(self):
+        for capacity in (20, 200):
+            self.assertGreaterEqual(len(self.solve('SAsimple2', capacity)), 30)
+    
+    def test_multi_agent(self):
+        # Reopening expanded states used to lose the nodes dropped below them, and the frontier ran empty.
+        for capacity in (20, 50):
+            self.assertGreaterEqual(len(self.solve('MAsimple2', capacity)), 30)
+
+if __name__ == '__main__':
+    unittest.main()